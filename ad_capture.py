@@ -0,0 +1,448 @@
+"""
+Numpy building blocks for the capture path in 'ad_thread'.
+
+This module must not depend on the hardware driver:
+It is used by the benchmarks without a pico connected.
+"""
+
+from __future__ import annotations
+import os
+import json
+import shutil
+import typing
+import pathlib
+import datetime
+
+import numpy as np
+
+DEFAULT_CAPACITY_SAMPLES = 1 << 16
+"""
+Used if the size of a capture is not known in advance.
+"""
+
+SHOT_DIRECTORIES_KEEP = 2
+"""
+Default of 'capture_keep_shots': The number of shots kept in 'capture_directory'.
+0: All shots are kept.
+"""
+
+PROGRESS_INTERVAL_S = 1.0
+"""
+While capturing, the transitions and 'shot.json' are written at this interval:
+A crash of Labber leaves a usable shot directory.
+"""
+
+
+class GrowableArray:
+    """
+    A preallocated numpy array.
+    Chunks are written in place. If the capacity is exhausted, the capacity is doubled
+    (amortized O(1) per sample).
+
+    >>> a = GrowableArray(capacity=2)
+    >>> a.append(np.array([1, 2, 3]))
+    >>> a.append(np.array([4]))
+    >>> a.view()
+    array([1, 2, 3, 4])
+    >>> a.capacity
+    4
+    """
+
+    def __init__(self, capacity: int = DEFAULT_CAPACITY_SAMPLES):
+        self._capacity = max(int(capacity), 1)
+        self._array: typing.Optional[np.ndarray] = None
+        self.size = 0
+
+    @property
+    def capacity(self) -> int:
+        return self._capacity
+
+    def _allocate(self, capacity: int, dtype: np.dtype) -> np.ndarray:
+        return np.empty(capacity, dtype=dtype)
+
+    def _grow(self, size_required: int) -> None:
+        capacity = self._capacity
+        while capacity < size_required:
+            capacity *= 2
+        array = self._allocate(capacity, self._array.dtype)
+        array[: self.size] = self._array[: self.size]
+        self._array = array
+        self._capacity = capacity
+
+    def append(self, chunk: np.ndarray) -> None:
+        """
+        The dtype is taken from the first chunk.
+        """
+        if self._array is None:
+            self._array = self._allocate(self._capacity, chunk.dtype)
+        size_required = self.size + len(chunk)
+        if size_required > self._capacity:
+            self._grow(size_required)
+        self._array[self.size : size_required] = chunk
+        self.size = size_required
+
+    def discard_begin(self, idx0: int) -> None:
+        """
+        Drop the first 'idx0' samples: The remaining samples are moved to the beginning.
+
+        >>> a = GrowableArray()
+        >>> a.append(np.array([1, 2, 3, 4]))
+        >>> a.discard_begin(3)
+        >>> a.view()
+        array([4])
+        """
+        assert 0 <= idx0 <= self.size, (idx0, self.size)
+        size = self.size - idx0
+        if size > 0:
+            self._array[:size] = self._array[idx0 : self.size]
+        self.size = size
+
+    def view(self, begin: int = 0, end: typing.Optional[int] = None) -> np.ndarray:
+        """
+        Returns a view without copying the data.
+        The view is only valid until the next 'append()' as the array may be reallocated.
+        """
+        if self._array is None:
+            return np.array([])
+        if end is None:
+            end = self.size
+        assert 0 <= begin <= end <= self.size, (begin, end, self.size)
+        return self._array[begin:end]
+
+
+class MemmapArray(GrowableArray):
+    """
+    Like 'GrowableArray', but the array is a memory mapped '.npy' file.
+    The samples are written to disk while capturing: The memory stays flat
+    and the samples survive a crash of Labber.
+    """
+
+    def __init__(
+        self, filename: pathlib.Path, capacity: int = DEFAULT_CAPACITY_SAMPLES
+    ):
+        super().__init__(capacity=capacity)
+        self._filename_base = filename
+        self.filename = filename
+        self._generation = 0
+
+    def _allocate(self, capacity: int, dtype: np.dtype) -> np.ndarray:
+        filename = self._filename_base
+        if self._array is not None:
+            # Growing: A new file is required
+            self._generation += 1
+            filename = filename.with_name(f"{filename.stem}_{self._generation}.npy")
+        array = np.lib.format.open_memmap(
+            filename, mode="w+", dtype=dtype, shape=(capacity,)
+        )
+        self.filename = filename
+        return array
+
+    def _grow(self, size_required: int) -> None:
+        filename_previous = self.filename
+        super()._grow(size_required)
+        try:
+            filename_previous.unlink()
+        except OSError:
+            # Windows: The file is still mapped by a view
+            pass
+
+    def flush(self) -> None:
+        if self._array is not None:
+            self._array.flush()
+
+
+class DigitalArray:
+    """
+    A digital channel (like 'IN_disable') stored as transitions:
+    The value of the first sample and the indices of the samples which differ
+    from the sample before. The samples are only expanded on request.
+
+    >>> digital = DigitalArray()
+    >>> digital.append(np.array([1, 1, 0], dtype=bool))
+    >>> digital.append(np.array([0, 1, 1], dtype=bool))
+    >>> digital.transitions
+    array([2, 4])
+    >>> digital.view().astype(int)
+    array([1, 1, 0, 0, 1, 1])
+    >>> digital.view(begin=3, end=5).astype(int)
+    array([0, 1])
+    >>> digital.find_first(value_to_find=0, begin=0, end=6)
+    2
+    >>> digital.find_first(value_to_find=1, begin=2, end=6)
+    4
+    >>> digital.find_first(value_to_find=1, begin=2, end=4) is None
+    True
+    """
+
+    def __init__(self):
+        self.size = 0
+        self.value_first = False
+        self._value_last = False
+        self._transitions = GrowableArray(capacity=1024)
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def transitions(self) -> np.ndarray:
+        return self._transitions.view()
+
+    def append(self, chunk: np.ndarray) -> None:
+        if len(chunk) == 0:
+            return
+        chunk = chunk.astype(bool, copy=False)
+        if self.size == 0:
+            self.value_first = self._value_last = bool(chunk[0])
+        transitions = np.flatnonzero(chunk[1:] != chunk[:-1]) + 1
+        if chunk[0] != self._value_last:
+            # Transition on the chunk boundary
+            transitions = np.concatenate(([0], transitions))
+        self._transitions.append(transitions + self.size)
+        self._value_last = bool(chunk[-1])
+        self.size += len(chunk)
+
+    def value_at(self, idx0: int) -> bool:
+        transitions_before = int(np.searchsorted(self.transitions, idx0, side="right"))
+        return self.value_first ^ bool(transitions_before % 2)
+
+    def find_first(
+        self, value_to_find: int, begin: int, end: int
+    ) -> typing.Optional[int]:
+        """
+        Returns the index of the first sample in 'begin' to 'end' with 'value_to_find'.
+        Returns None if not found.
+        This is a lookup in the transitions: The samples are not expanded.
+        """
+        end = min(end, self.size)
+        if begin >= end:
+            return None
+        if self.value_at(begin) == bool(value_to_find):
+            return begin
+        # The value changes at the next transition
+        transitions = self.transitions
+        i = int(np.searchsorted(transitions, begin, side="right"))
+        if i < len(transitions) and transitions[i] < end:
+            return int(transitions[i])
+        return None
+
+    def view(self, begin: int = 0, end: typing.Optional[int] = None) -> np.ndarray:
+        """
+        Expands the samples 'begin' to 'end' to an array of bool.
+        """
+        if end is None:
+            end = self.size
+        assert 0 <= begin <= end <= self.size, (begin, end, self.size)
+        transitions = self.transitions
+        i_begin = int(np.searchsorted(transitions, begin, side="right"))
+        i_end = int(np.searchsorted(transitions, end, side="left"))
+        toggles = np.zeros(end - begin, dtype=np.uint8)
+        toggles[transitions[i_begin:i_end] - begin] = 1
+        samples = np.bitwise_xor.accumulate(toggles).astype(bool)
+        if self.value_first ^ bool(i_begin % 2):
+            np.logical_not(samples, out=samples)
+        return samples
+
+    def discard_begin(self, idx0: int) -> None:
+        """
+        Drop the first 'idx0' samples.
+        """
+        assert 0 <= idx0 <= self.size, (idx0, self.size)
+        if idx0 == 0:
+            return
+        value_first = self.value_at(idx0) if idx0 < self.size else self._value_last
+        transitions = self.transitions
+        remaining = transitions[np.searchsorted(transitions, idx0, side="right") :]
+        remaining = remaining - idx0
+        self._transitions.discard_begin(self._transitions.size)
+        self._transitions.append(remaining)
+        self.value_first = value_first
+        self.size -= idx0
+
+    def flush(self) -> None:
+        pass
+
+    def save(self, filename: pathlib.Path) -> dict:
+        """
+        Save the transitions: Returns the info to be added to 'shot.json'.
+        May be called repeatedly while capturing: The file is replaced atomically.
+        """
+        filename_tmp = filename.with_name(filename.name + ".tmp")
+        with filename_tmp.open("wb") as f:
+            np.save(f, self.transitions)
+        os.replace(filename_tmp, filename)
+        return dict(value_first=self.value_first, transitions=filename.name)
+
+
+def create_shot_directory(
+    capture_directory: pathlib.Path, keep_shots: int = SHOT_DIRECTORIES_KEEP
+) -> typing.Tuple[pathlib.Path, typing.List[pathlib.Path]]:
+    """
+    Returns a new directory for the files of a shot and the directories of older shots removed.
+    keep_shots: The number of shot directories kept, including the new one. 0: All are kept.
+    """
+    capture_directory.mkdir(parents=True, exist_ok=True)
+    directories_to_remove: typing.List[pathlib.Path] = []
+    if keep_shots > 0:
+        shot_directories = sorted(capture_directory.glob("shot_*"))
+        # One more directory is created below
+        directories_to_remove = shot_directories[
+            : max(0, len(shot_directories) - (keep_shots - 1))
+        ]
+    for shot_directory in directories_to_remove:
+        # Windows: Files which are still mapped may not be deleted
+        shutil.rmtree(shot_directory, ignore_errors=True)
+    shot_directory = capture_directory / datetime.datetime.now().strftime(
+        "shot_%Y-%m-%d_%H-%M-%S_%f"
+    )
+    shot_directory.mkdir()
+    return shot_directory, directories_to_remove
+
+
+def save_shot_info(shot_directory: pathlib.Path, info: dict) -> None:
+    filename = shot_directory / "shot.json"
+    filename_tmp = shot_directory / "shot.json.tmp"
+    filename_tmp.write_text(json.dumps(info, indent=2))
+    # Atomic: A crash leaves the previous progress record
+    os.replace(filename_tmp, filename)
+
+
+class EdgeDetector:
+    """
+    Finds the first sample with a given value in an array which grows chunk by chunk.
+
+    A cursor remembers how far the array has already been scanned:
+    Only the samples which arrived since the last call are searched and the search
+    stops at the first hit.
+    All samples before the cursor are known to differ from the value searched,
+    so a hit is always an edge - also if it is the first sample of a new chunk.
+
+    Edge exactly on a chunk boundary:
+
+    >>> detector = EdgeDetector()
+    >>> detector.find_first(np.array([1, 1, 1], bool), value_to_find=0) is None
+    True
+    >>> detector.cursor
+    3
+    >>> detector.find_first(np.array([1, 1, 1, 0, 0], bool), value_to_find=0)
+    3
+
+    The cursor stays on the hit: The next search starts at the edge
+
+    >>> detector.find_first(np.array([1, 1, 1, 0, 0, 1], bool), value_to_find=1)
+    5
+
+    Edge on the last sample of a chunk
+
+    >>> detector = EdgeDetector()
+    >>> detector.find_first(np.array([1, 1, 0], bool), value_to_find=0)
+    2
+
+    Edge on the very first sample
+
+    >>> EdgeDetector().find_first(np.array([0, 1], bool), value_to_find=0)
+    0
+
+    A 'DigitalArray' is searched by a lookup in its transitions
+
+    >>> digital = DigitalArray()
+    >>> digital.append(np.array([1, 1, 1, 0, 0, 1], bool))
+    >>> detector = EdgeDetector()
+    >>> detector.find_first(digital, value_to_find=0, end=3) is None
+    True
+    >>> detector.find_first(digital, value_to_find=0)
+    3
+
+    Searches larger than 'block_samples' stop at the first hit
+
+    >>> detector = EdgeDetector(block_samples=2)
+    >>> detector.find_first(np.array([1, 1, 1, 1, 0, 1, 0], bool), value_to_find=0)
+    4
+    """
+
+    def __init__(self, cursor: int = 0, block_samples: int = 1 << 14):
+        self.cursor = cursor
+        self.block_samples = block_samples
+
+    def find_first(
+        self,
+        array_of_bool: typing.Union[np.ndarray, DigitalArray],
+        value_to_find: int,
+        end: typing.Optional[int] = None,
+    ) -> typing.Optional[int]:
+        """
+        Returns the absolute index of the first 'value_to_find' at or after the cursor
+        and before 'end'.
+        Returns None if not found: The cursor is then at the end of the samples searched.
+        """
+        size = len(array_of_bool) if end is None else min(end, len(array_of_bool))
+        if isinstance(array_of_bool, DigitalArray):
+            # A lookup in the transitions
+            idx0 = array_of_bool.find_first(
+                value_to_find=value_to_find, begin=self.cursor, end=size
+            )
+            self.cursor = max(self.cursor, size) if idx0 is None else idx0
+            return idx0
+        while self.cursor < size:
+            end = min(self.cursor + self.block_samples, size)
+            hits = array_of_bool[self.cursor : end] == value_to_find
+            idx0 = int(np.argmax(hits))
+            if hits[idx0]:
+                self.cursor += idx0
+                return self.cursor
+            self.cursor = end
+        return None
+
+
+class RingBuffer:
+    """
+    Keeps the last 'capacity' samples.
+    The array is allocated once: 'write()' does not allocate anything.
+
+    >>> ring = RingBuffer(capacity=4)
+    >>> ring.write(np.array([1, 2, 3]))
+    >>> ring.write(np.array([4, 5]))
+    >>> np.concatenate(ring.views())
+    array([2, 3, 4, 5])
+    >>> ring.write(np.array([6, 7, 8, 9, 10]))
+    >>> np.concatenate(ring.views())
+    array([ 7,  8,  9, 10])
+    """
+
+    def __init__(self, capacity: int):
+        self.capacity = max(int(capacity), 0)
+        self._array: typing.Optional[np.ndarray] = None
+        self._head = 0
+        "Index of the next sample to be written"
+        self.size = 0
+
+    def clear(self) -> None:
+        self._head = 0
+        self.size = 0
+
+    def write(self, chunk: np.ndarray) -> None:
+        if self.capacity == 0:
+            return
+        if self._array is None:
+            self._array = np.empty(self.capacity, dtype=chunk.dtype)
+        n = len(chunk)
+        if n >= self.capacity:
+            self._array[:] = chunk[n - self.capacity :]
+            self._head = 0
+            self.size = self.capacity
+            return
+        n_till_end = min(n, self.capacity - self._head)
+        self._array[self._head : self._head + n_till_end] = chunk[:n_till_end]
+        self._array[: n - n_till_end] = chunk[n_till_end:]
+        self._head = (self._head + n) % self.capacity
+        self.size = min(self.size + n, self.capacity)
+
+    def views(self) -> typing.Tuple[np.ndarray, ...]:
+        """
+        Returns the samples, oldest first, as views without copying the data.
+        """
+        if self.size == 0:
+            return ()
+        if self.size < self.capacity:
+            # Not wrapped yet
+            return (self._array[: self.size],)
+        return (self._array[self._head :], self._array[: self._head])
@@ -0,0 +1,200 @@
+"""
+Detect samples lost between the pico and the host.
+
+'MeasurementSequence' carries no sequence counter. Two indications are used:
+
+ * The error bits in 'MeasurementSequence.errors' (for example a buffer overflow on the pico).
+ * The sample rate: The samples received (plus the backlog in the decoder) are compared
+   with the time elapsed times the sample rate.
+   A stall of the host delays the samples but they arrive later: The deficit shrinks while catching up.
+   Lost samples never arrive: The deficit stops shrinking and stays elevated.
+"""
+
+from __future__ import annotations
+import enum
+import typing
+import collections
+import dataclasses
+
+from logging_utils import EnumMixin
+
+TOLERANCE_S = 0.05
+"""
+Jitter of the arrival of the chunks (USB, scheduling) which is not reported as a loss.
+"""
+
+CONFIRM_S = 0.1
+"""
+An elevated deficit has to stop shrinking for this time to be reported as a loss.
+While the host catches up after a stall, the deficit shrinks: However long the stall was.
+"""
+
+PROGRESS_S = 0.005
+"""
+The deficit has shrunk if it dropped by more than this time since the last progress.
+Smaller than 'TOLERANCE_S': The jitter of the arrival does not count as progress for long.
+"""
+
+FLOOR_WINDOW_S = 10.0
+"""
+The floor is the minimal deficit within this window.
+The clocks of the pico and the host differ (crystal tolerance of about 100ppm, temperature):
+The deficit drifts slowly and the floor follows with a lag of the drift within this window.
+"""
+
+
+class SampleLossPolicy(EnumMixin, enum.Enum):
+    IGNORE = "IGNORE"
+    "Report 'samples_lost' only"
+    FAIL = "FAIL"
+    "Raise an exception if samples are lost during a shot"
+    RETRY = "RETRY"
+    "Capture the shot again. Raise an exception if the retries are exhausted."
+
+
+@dataclasses.dataclass(frozen=True)
+class Gap:
+    idx0_stream: int
+    """
+    Position in samples received since the connect:
+    The first chunk which showed the loss. The samples were lost before or within this chunk.
+    """
+    samples: int
+    "Estimated number of samples lost. 0 if the size is unknown."
+    reason: str
+
+
+class _Suspect:
+    """
+    The deficit exceeded the floor: Either a stall of the host or lost samples.
+    """
+
+    def __init__(self, idx0_stream: int, now_s: float, deficit: float):
+        self.idx0_stream = idx0_stream
+        self.deficit_min = deficit
+        self.deficit_progress = deficit
+        "The deficit when it shrunk the last time"
+        self.progress_s = now_s
+        "The time when the deficit shrunk the last time"
+
+
+class ContinuityChecker:
+    """
+    Called for every chunk, also while not capturing: The deficit of the samples is tracked continuously.
+
+    >>> checker = ContinuityChecker(sps=1000.0)
+    >>> checker.chunk(samples=100, now_s=0.1)
+    >>> checker.chunk(samples=100, now_s=0.2)
+    >>> checker.chunk(samples=100, now_s=0.8)  # Stall
+    >>> checker.chunk(samples=500, now_s=0.81)  # Recovered
+    >>> checker.chunk(samples=100, now_s=0.91)
+    >>> checker.chunk(samples=100, now_s=1.5)  # Stall
+    >>> checker.chunk(samples=200, now_s=1.5)  # Not recovered: 300 samples lost
+    >>> checker.chunk(samples=100, now_s=1.6)
+    >>> checker.chunk(samples=100, now_s=1.7)  # Stopped shrinking for 'CONFIRM_S'
+    >>> checker.gaps
+    [Gap(idx0_stream=900, samples=300, reason='rate')]
+
+    The pico clock is 100ppm slow: No loss, even after hours.
+
+    >>> checker = ContinuityChecker(sps=1000.0)
+    >>> for i in range(1, 36_001):
+    ...     checker.chunk(samples=1000, now_s=i * 1.0001)
+    >>> checker.gaps
+    []
+    """
+
+    def __init__(self, sps: float):
+        self.sps = sps
+        self.gaps: typing.List[Gap] = []
+        "The gaps found so far. May be cleared by the caller."
+        self._tolerance_samples = TOLERANCE_S * sps
+        self._begin_s: typing.Optional[float] = None
+        self._idx0_stream = 0
+        self._floor: typing.Deque[typing.Tuple[float, float]] = collections.deque()
+        """
+        time and deficit, the deficits increasing: The first entry is the deficit with the
+        smallest latency within 'FLOOR_WINDOW_S'. The reference to detect a loss.
+        """
+        self._progress_samples = PROGRESS_S * sps
+        self._suspect: typing.Optional[_Suspect] = None
+
+    def chunk(
+        self,
+        samples: int,
+        now_s: float,
+        backlog_samples: int = 0,
+        errors: typing.Sequence[str] = (),
+    ) -> None:
+        """
+        samples: The samples in this chunk.
+        now_s: time.monotonic() when the chunk was received.
+        backlog_samples: Samples received by the host but not decoded yet.
+        errors: The error bits of this chunk, see 'pcb_status.list_errors()'.
+        """
+        idx0_stream = self._idx0_stream
+        self._idx0_stream += samples
+        if len(errors) > 0:
+            self.gaps.append(
+                Gap(idx0_stream=idx0_stream, samples=0, reason=" ".join(errors))
+            )
+        if self._begin_s is None:
+            # The samples of the first chunk were acquired before 'now_s'
+            self._begin_s = now_s - samples / self.sps
+        deficit = (now_s - self._begin_s) * self.sps - (
+            self._idx0_stream + backlog_samples
+        )
+
+        if len(self._floor) == 0 or (
+            deficit <= self._floor[0][1] + self._tolerance_samples
+        ):
+            # Latency as before: Nothing lost
+            self._add_floor(deficit, now_s=now_s)
+            self._suspect = None
+            return
+
+        suspect = self._suspect
+        if suspect is None:
+            self._suspect = _Suspect(
+                idx0_stream=idx0_stream, now_s=now_s, deficit=deficit
+            )
+            return
+
+        suspect.deficit_min = min(suspect.deficit_min, deficit)
+        if deficit < suspect.deficit_progress - self._progress_samples:
+            # Catching up after a stall
+            suspect.deficit_progress = deficit
+            suspect.progress_s = now_s
+            return
+        if now_s - suspect.progress_s < CONFIRM_S:
+            return
+
+        # The deficit stopped shrinking: The samples are lost
+        self.gaps.append(
+            Gap(
+                idx0_stream=suspect.idx0_stream,
+                samples=int(round(suspect.deficit_min - self._floor[0][1])),
+                reason="rate",
+            )
+        )
+        self._floor.clear()
+        self._add_floor(suspect.deficit_min, now_s=now_s)
+        self._suspect = None
+
+    def _add_floor(self, deficit: float, now_s: float) -> None:
+        floor = self._floor
+        while len(floor) > 0 and floor[-1][1] >= deficit:
+            floor.pop()
+        floor.append((now_s, deficit))
+        while floor[0][0] < now_s - FLOOR_WINDOW_S:
+            floor.popleft()
+
+    def dropped(self, samples: int) -> None:
+        """
+        The host dropped these samples (see 'ad_pipeline.BackPressure'): They arrived but were not processed.
+        Called before the chunk following the dropped samples.
+        """
+        self.gaps.append(
+            Gap(idx0_stream=self._idx0_stream, samples=samples, reason="queue")
+        )
+        self._idx0_stream += samples
@@ -0,0 +1,146 @@
+"""
+Reduce the number of samples returned to Labber.
+
+The capture itself always runs at the full sample rate (timing accuracy of the edges).
+Only the trace returned to Labber is decimated.
+"""
+
+from __future__ import annotations
+import enum
+
+import numpy as np
+
+from logging_utils import EnumMixin
+
+BLOCK_SAMPLES = 1 << 16
+"""
+The samples are fed block by block: The temporary arrays are bounded by this size.
+"""
+
+CIC_ORDER = 3
+
+
+class DecimationMode(EnumMixin, enum.Enum):
+    MEAN = "MEAN"
+    "Mean per bin (boxcar, CIC of order 1)"
+    CIC3 = "CIC3"
+    "CIC of order 3: Better suppression of aliasing. Delay of 1.5 bins."
+    ENVELOPE = "ENVELOPE"
+    "Minimum and maximum per bin, interleaved"
+
+
+class Decimator:
+    """
+    Decimates a stream of samples chunk by chunk.
+    Samples which do not fill a bin are carried over to the next chunk.
+
+    >>> decimator = Decimator(factor=3, mode=DecimationMode.MEAN)
+    >>> decimator.feed(np.array([1.0, 2.0, 3.0, 4.0]))
+    array([2.])
+    >>> decimator.feed(np.array([5.0, 6.0, 7.0]))
+    array([5.])
+    >>> decimator.flush()
+    array([7.])
+
+    >>> decimator = Decimator(factor=2, mode=DecimationMode.ENVELOPE)
+    >>> decimator.feed(np.array([1, 3, 2, 0], dtype=bool))
+    array([1., 1., 0., 1.])
+    """
+
+    def __init__(self, factor: int, mode: DecimationMode):
+        assert factor >= 1, factor
+        assert isinstance(mode, DecimationMode)
+        self.factor = factor
+        self.mode = mode
+        self._carry = np.empty(0, dtype=np.float64)
+        self._count = 0
+        "Number of samples fed so far"
+
+    def _reduce(self, bins: np.ndarray) -> np.ndarray:
+        if self.mode is DecimationMode.ENVELOPE:
+            envelope = np.empty(2 * len(bins), dtype=np.float64)
+            envelope[0::2] = bins.min(axis=1)
+            envelope[1::2] = bins.max(axis=1)
+            return envelope
+        return bins.mean(axis=1)
+
+    def feed(self, chunk: np.ndarray) -> np.ndarray:
+        """
+        Returns the decimated samples which are complete.
+        """
+        if self.mode is DecimationMode.CIC3:
+            return self._feed_cic(chunk)
+
+        samples = chunk.astype(np.float64, copy=False)
+        if len(self._carry) > 0:
+            samples = np.concatenate((self._carry, samples))
+        bins = len(samples) // self.factor
+        self._carry = samples[bins * self.factor :].copy()
+        self._count += len(chunk)
+        return self._reduce(samples[: bins * self.factor].reshape(bins, self.factor))
+
+    def _feed_cic(self, chunk: np.ndarray) -> np.ndarray:
+        """
+        A CIC filter is a cascade of boxcar filters of length 'factor'.
+        The boxcars are calculated with cumsum per chunk:
+        In contrary to the integrators of a hardware CIC, the sums do not grow unbounded.
+        """
+        history = CIC_ORDER * (self.factor - 1)
+        samples = chunk.astype(np.float64, copy=False)
+        if len(samples) == 0:
+            return np.empty(0, dtype=np.float64)
+        if self._count == 0:
+            # Start in steady state
+            self._carry = np.full(history, samples[0])
+        samples = np.concatenate((self._carry, samples))
+        filtered = samples
+        for _ in range(CIC_ORDER):
+            cumsum = np.concatenate(([0.0], np.cumsum(filtered)))
+            filtered = (cumsum[self.factor :] - cumsum[: -self.factor]) / self.factor
+        # 'filtered[j]' ends with the input sample 'self._count + j':
+        # Pick the samples at the end of each bin.
+        idx0_first = (self.factor - 1 - self._count) % self.factor
+        self._carry = samples[len(samples) - history :].copy()
+        self._count += len(chunk)
+        return filtered[idx0_first :: self.factor]
+
+    def flush(self) -> np.ndarray:
+        """
+        Returns the last bin, even if not complete.
+        """
+        if (self.mode is DecimationMode.CIC3) or (len(self._carry) == 0):
+            return np.empty(0, dtype=np.float64)
+        last_bin = self._carry.reshape(1, -1)
+        self._carry = np.empty(0, dtype=np.float64)
+        return self._reduce(last_bin)
+
+
+def decimated_dt_s(sps: float, factor: int, mode: DecimationMode) -> float:
+    """
+    Returns the 'dt' of the array returned by 'decimate()'.
+    """
+    if factor == 1:
+        return 1.0 / sps
+    if mode is DecimationMode.ENVELOPE:
+        return factor / (2.0 * sps)
+    return factor / sps
+
+
+def decimate(array: np.ndarray, factor: int, mode: DecimationMode) -> np.ndarray:
+    """
+    Returns 'array' if 'factor' is 1: No copy.
+
+    >>> decimate(np.arange(10), factor=4, mode=DecimationMode.MEAN)
+    array([1.5, 5.5, 8.5])
+    >>> decimate(np.ones(10), factor=4, mode=DecimationMode.CIC3)
+    array([1., 1.])
+    """
+    if factor == 1:
+        return array
+    decimator = Decimator(factor=factor, mode=mode)
+    reduced = [
+        decimator.feed(array[idx0 : idx0 + BLOCK_SAMPLES])
+        for idx0 in range(0, len(array), BLOCK_SAMPLES)
+    ]
+    reduced.append(decimator.flush())
+    return np.concatenate(reduced)
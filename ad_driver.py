@@ -30,11 +30,24 @@ LIST_MEASUREMENTS = [
     "IN_t",
     "IN_disable",
     "IN_voltage",
+    "IN_voltage_crossings_s",
+    "IN_t_edges_s",
+    "IN_voltage_psd",
     "timeout_detected",
     "enable_start_detected",
     "enable_end_detected",
     "enable_start_s",
     "enable_s",
+    "shots_captured",
+    "samples_lost",
+    "gaps_detected",
+    "statistics_samples",
+    "statistics_mean_V",
+    "statistics_std_V",
+    "statistics_rms_V",
+    "statistics_min_V",
+    "statistics_max_V",
+    "statistics_integral_Vs",
 ]
 """
 This lists all quantities which should trigger new traces"""
@@ -47,6 +60,7 @@ class Driver(InstrumentDriver.InstrumentWorker):
         super().__init__(*args, **kwargs)
         self._thread: typing.Optional[ad_thread.AdThread] = None
         self.dict_channels = {ch.label: ch for ch in ad_utils.CHANNELS}
+        self._trace_cache = ad_utils.TraceCache()
 
     def performOpen(self, options={}):
         """Perform the operation of opening the instrument connection"""
@@ -55,7 +69,8 @@ class Driver(InstrumentDriver.InstrumentWorker):
         assert self._thread is None
         self._thread = ad_thread.AdThread()
         self._thread.start()
-        self._thread.wait_startup()
+        # Do not wait for the pico: Labber pushes the configuration while the pico connects.
+        # 'wait_startup()' is called before the first measurement.
 
     def performClose(self, bError=False, options={}):
         """Perform the close instrument connection operation"""
@@ -79,10 +94,15 @@ class Driver(InstrumentDriver.InstrumentWorker):
             if new_value is None:
                 logger.warning(f"Nobody was setting '{quant.name}'...")
 
-        first_call = "FIRST" if self.isFirstCall(options) else ""
-        logger.info(
-            f"performSetValue('{quant.name}', {value_before} -> {new_value}) {first_call} {time.monotonic()-begin_s:0.2f}s"
-        )
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(
+                "performSetValue('%s', %s -> %s) %s %0.2fs",
+                quant.name,
+                value_before,
+                new_value,
+                "FIRST" if self.isFirstCall(options) else "",
+                time.monotonic() - begin_s,
+            )
 
         return new_value
 
@@ -92,20 +112,23 @@ class Driver(InstrumentDriver.InstrumentWorker):
 
     def performGetValue(self, quant, options={}):
         begin_s = time.monotonic()
-        rc = self._performGetValue(quant=quant, options=options)
+        isFirstCall = self.isFirstCall(options)
+        rc = self._performGetValue(quant=quant, isFirstCall=isFirstCall)
+        # One line per call: 'FIRST' and the duration
         logger.info(
-            f"performGetValue('{quant.name}') returned {time.monotonic()-begin_s:0.2f}s"
+            "performGetValue('%s') %s %0.2fs",
+            quant.name,
+            "FIRST" if isFirstCall else "",
+            time.monotonic() - begin_s,
         )
         return rc
 
-    def _performGetValue(self, quant, options={}):
+    def _performGetValue(self, quant, isFirstCall: bool):
         """Perform the Get Value instrument operation"""
         # only implmeneted for geophone voltage
-        isFirstCall = self.isFirstCall(options)
-        first_call = "FIRST" if isFirstCall else ""
-        logger.info(f"performGetValue('{quant.name}') {first_call}")
 
         if isFirstCall:
+            self._thread.wait_startup()
             self._thread.wait_measurements()
 
         value = self._thread.get_quantity_sync(quant)
@@ -118,10 +141,13 @@ class Driver(InstrumentDriver.InstrumentWorker):
         #     self._thread.wait_measurements()
         channel = self.dict_channels.get(quant.name, None)
         if channel is not None:
-            assert len(channel.data) > 0, (channel.label, len(channel.data))
+            assert channel.allow_empty or (len(channel.data) > 0), (
+                channel.label,
+                len(channel.data),
+            )
             # return correct data
-            return quant.getTraceDict(
-                channel.data, dt=1.0 / self._thread._aquisition._sps
+            return self._trace_cache.trace_dict(
+                shot_id=self._thread.shot_id, channel=channel, quant=quant
             )
 
         # just return the quantity value
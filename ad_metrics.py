@@ -0,0 +1,228 @@
+"""
+Low overhead metrics of the acquisition thread.
+
+The acquisition thread updates the counters of the current interval for every chunk.
+At the end of every interval, the thread 'AdMetrics' publishes a snapshot (and optionally appends it
+to a JSON-lines file): The acquisition thread does no file I/O and does not wait for 'LOCK'.
+The Labber thread only reads the published snapshot.
+"""
+
+from __future__ import annotations
+import json
+import time
+import bisect
+import pathlib
+import logging
+import threading
+import typing
+
+from ad_low_noise_float_2023.ad import LOGGER_NAME
+
+from ad_pipeline import ChunkQueue
+
+logger = logging.getLogger(LOGGER_NAME)
+
+BUCKET_BOUNDS_S = tuple(1e-6 * 2**i for i in range(25))
+"""
+Upper bounds of the buckets of 'Histogram': 1us, 2us, 4us ... 16.8s
+"""
+
+DEFAULT_INTERVAL_S = 10.0
+
+
+class Histogram:
+    """
+    Durations in buckets of powers of 2.
+    Recording is cheap: No allocation, no numpy.
+
+    >>> histogram = Histogram()
+    >>> for duration_s in (3e-6, 3e-6, 3e-6, 100e-6):
+    ...     histogram.record(duration_s)
+    >>> histogram.percentile_s(50)
+    4e-06
+    >>> histogram.percentile_s(99)
+    0.0001
+    """
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKET_BOUNDS_S) + 1)
+        self.count = 0
+        self.sum_s = 0.0
+        self.max_s = 0.0
+
+    def record(self, duration_s: float) -> None:
+        self.counts[bisect.bisect_left(BUCKET_BOUNDS_S, duration_s)] += 1
+        self.count += 1
+        self.sum_s += duration_s
+        if duration_s > self.max_s:
+            self.max_s = duration_s
+
+    def percentile_s(self, percent: float) -> float:
+        """
+        Returns the upper bound of the bucket containing the percentile, at most 'max_s'.
+        Returns 0.0 if nothing was recorded.
+        """
+        if self.count == 0:
+            return 0.0
+        threshold = percent / 100.0 * self.count
+        cumulative = 0
+        for bound_s, count in zip(BUCKET_BOUNDS_S, self.counts):
+            cumulative += count
+            if cumulative >= threshold:
+                return min(bound_s, self.max_s)
+        return self.max_s
+
+
+class TimedLock:
+    """
+    A 'threading.Lock' which records how long it was held.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._acquired_s = 0.0
+        self.held = Histogram()
+
+    def __enter__(self) -> TimedLock:
+        self._lock.acquire()
+        self._acquired_s = time.perf_counter()
+        return self
+
+    def __exit__(self, *args) -> None:
+        # Recorded while still holding the lock: 'held' is only modified by the owner.
+        self.held.record(time.perf_counter() - self._acquired_s)
+        self._lock.release()
+
+    def take_held(self) -> Histogram:
+        """
+        Returns the durations recorded so far and starts over.
+        """
+        with self._lock:
+            held, self.held = self.held, Histogram()
+        return held
+
+
+class _Interval:
+    def __init__(self, begin_s: float):
+        self.begin_s = begin_s
+        self.chunks = 0
+        self.samples = 0
+        self.chunk_time = Histogram()
+        self.decoder_backlog_bytes_max = 0
+        self.chunks_with_errors = 0
+        self.errors_or = 0
+        "All error bits seen in this interval"
+
+
+class Metrics:
+    """
+    Updated by the acquisition thread for every chunk.
+    'snapshot' is the last completed interval: It is replaced as a whole and may be read without lock.
+    The snapshot is published by the thread started by 'start()': Also if no chunks arrive.
+    """
+
+    def __init__(
+        self,
+        lock: typing.Optional[TimedLock] = None,
+        describe_errors: typing.Optional[
+            typing.Callable[[int], typing.List[str]]
+        ] = None,
+        queue: typing.Optional[ChunkQueue] = None,
+    ):
+        """
+        lock: The hold times of this lock are reported.
+        describe_errors: Returns the names of the error bits in 'MeasurementSequence.errors'.
+        queue: The depth and the dropped chunks of this queue are reported.
+        """
+        self.lock = lock
+        self.describe_errors = describe_errors
+        self.queue = queue
+        self._dropped_chunks = 0
+        "'queue.dropped_chunks' at the end of the last interval"
+        self.interval_s = DEFAULT_INTERVAL_S
+        self.filename: typing.Optional[pathlib.Path] = None
+        "If set, every snapshot is appended as a JSON line."
+        self.snapshot: typing.Dict[str, typing.Any] = {}
+        self._interval = _Interval(begin_s=time.monotonic())
+        self._interval_lock = threading.Lock()
+        "Held very shortly: Updating the counters or replacing '_interval'."
+        self._stop_event = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="AdMetrics", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop_event.set()
+        if self._thread.is_alive():
+            self._thread.join(timeout=10.0)
+
+    def _run(self) -> None:
+        while True:
+            # 'interval_s' may be changed by Labber at any time
+            remaining_s = self._interval.begin_s + self.interval_s - time.monotonic()
+            if self._stop_event.wait(timeout=max(0.0, remaining_s)):
+                return
+            now_s = time.monotonic()
+            if now_s - self._interval.begin_s >= self.interval_s:
+                self._publish(now_s=now_s)
+
+    def chunk(
+        self, samples: int, duration_s: float, decoder_backlog_bytes: int, errors: int
+    ) -> None:
+        """
+        Called for every chunk by the acquisition thread.
+        duration_s: Time to handle this chunk.
+        """
+        with self._interval_lock:
+            interval = self._interval
+            interval.chunks += 1
+            interval.samples += samples
+            interval.chunk_time.record(duration_s)
+            if decoder_backlog_bytes > interval.decoder_backlog_bytes_max:
+                interval.decoder_backlog_bytes_max = decoder_backlog_bytes
+            if errors:
+                interval.chunks_with_errors += 1
+                interval.errors_or |= int(errors)
+
+    def _publish(self, now_s: float) -> None:
+        """
+        Called by the thread 'AdMetrics'.
+        """
+        with self._interval_lock:
+            interval = self._interval
+            self._interval = _Interval(begin_s=now_s)
+        duration_s = now_s - interval.begin_s
+        chunk_time = interval.chunk_time
+        snapshot: typing.Dict[str, typing.Any] = dict(
+            time=time.strftime("%Y-%m-%d %H:%M:%S"),
+            interval_s=duration_s,
+            chunks_per_s=interval.chunks / duration_s,
+            samples_per_s=interval.samples / duration_s,
+            busy_percent=100.0 * chunk_time.sum_s / duration_s,
+            chunk_us_p50=1e6 * chunk_time.percentile_s(50),
+            chunk_us_p99=1e6 * chunk_time.percentile_s(99),
+            chunk_us_max=1e6 * chunk_time.max_s,
+            decoder_backlog_bytes=interval.decoder_backlog_bytes_max,
+            chunks_with_errors=interval.chunks_with_errors,
+            errors=f"{interval.errors_or:016b}",
+        )
+        if interval.errors_or and (self.describe_errors is not None):
+            snapshot["errors"] = " ".join(self.describe_errors(interval.errors_or))
+        if self.lock is not None:
+            held = self.lock.take_held()
+            snapshot["lock_held_ms_p99"] = 1e3 * held.percentile_s(99)
+            snapshot["lock_held_ms_max"] = 1e3 * held.max_s
+        if self.queue is not None:
+            dropped_chunks = self.queue.dropped_chunks
+            snapshot["queue_depth_max"] = self.queue.take_depth_max()
+            snapshot["queue_dropped_chunks"] = dropped_chunks - self._dropped_chunks
+            self._dropped_chunks = dropped_chunks
+        self.snapshot = snapshot
+
+        if self.filename is not None:
+            try:
+                with self.filename.open("a") as f:
+                    f.write(json.dumps(snapshot) + "\n")
+            except OSError as e:
+                logger.warning(f"Failed to write metrics to {self.filename}: {e}")
@@ -0,0 +1,183 @@
+"""
+Decouples reading the pico from processing the chunks.
+
+The reader thread only drains the pico ('ad.iter_measurements_V()') and puts the chunks
+into a bounded 'ChunkQueue'. The processing thread takes the chunks and does the capture work.
+A spike in the processing delays the chunks in the queue but does not stall the USB reading.
+"""
+
+from __future__ import annotations
+import enum
+import time
+import typing
+import threading
+import collections
+
+from logging_utils import EnumMixin
+
+DEFAULT_QUEUE_SIZE = 256
+"""
+Chunks. The pico sends about 100 chunks/s at the highest sample rate.
+"""
+
+
+class BackPressure(EnumMixin, enum.Enum):
+    """
+    What happens if the queue is full.
+    """
+
+    BLOCK = "BLOCK"
+    "The reader waits for the processing: The samples back up in the pico."
+    DROP_OLDEST = "DROP_OLDEST"
+    "The oldest chunk in the queue is dropped."
+    DROP_NEWEST = "DROP_NEWEST"
+    "The new chunk is dropped."
+
+
+class _Entry:
+    __slots__ = ("chunk", "samples", "arrival_s", "control", "dropped_before")
+
+    def __init__(
+        self, chunk: typing.Any, samples: int, arrival_s: float, control: bool
+    ):
+        self.chunk = chunk
+        self.samples = samples
+        self.arrival_s = arrival_s
+        self.control = control
+        "A control entry is never dropped."
+        self.dropped_before = 0
+        "Samples dropped between the entry before and this entry."
+
+
+class ChunkQueue:
+    """
+    A bounded queue between one reader and one processing thread.
+    The dropped samples are reported with the entry which follows them:
+    The processing thread knows where the stream was interrupted.
+
+    >>> queue = ChunkQueue(maxsize=2, back_pressure=BackPressure.DROP_OLDEST)
+    >>> for chunk in ("a", "b", "c"):
+    ...     queue.put(chunk, samples=10)
+    >>> entry = queue.get(timeout_s=0.0)
+    >>> entry.chunk, entry.dropped_before
+    ('b', 10)
+    >>> queue.get(timeout_s=0.0).chunk
+    'c'
+    >>> queue.get(timeout_s=0.0) is None
+    True
+    >>> queue.dropped_chunks, queue.take_depth_max()
+    (1, 2)
+
+    Control entries are never dropped:
+
+    >>> queue.put("reconnect", samples=0, force=True)
+    >>> for chunk in ("d", "e", "f"):
+    ...     queue.put(chunk, samples=10)
+    >>> [queue.get(timeout_s=0.0).chunk for _ in range(queue.depth)]
+    ['reconnect', 'f']
+    """
+
+    def __init__(
+        self,
+        maxsize: int = DEFAULT_QUEUE_SIZE,
+        back_pressure: BackPressure = BackPressure.BLOCK,
+    ):
+        assert maxsize >= 1, maxsize
+        self.maxsize = maxsize
+        self.back_pressure = back_pressure
+        self.dropped_chunks = 0
+        "Since the creation of the queue"
+        self._entries: typing.Deque[_Entry] = collections.deque()
+        self._condition = threading.Condition(threading.Lock())
+        self._dropped_pending = 0
+        "Samples dropped after the last entry in the queue"
+        self._depth_max = 0
+        self._closed = False
+
+    @property
+    def depth(self) -> int:
+        return len(self._entries)
+
+    def take_depth_max(self) -> int:
+        """
+        Returns the maximal depth since the last call and starts over.
+        """
+        with self._condition:
+            depth_max, self._depth_max = self._depth_max, len(self._entries)
+        return depth_max
+
+    def put(self, chunk: typing.Any, samples: int, force: bool = False) -> None:
+        """
+        Called by the reader thread.
+        force: A control entry: Queued even if the queue is full and never dropped.
+        """
+        entry = _Entry(
+            chunk=chunk, samples=samples, arrival_s=time.monotonic(), control=force
+        )
+        with self._condition:
+            if self._closed:
+                return
+            if not force and len(self._entries) >= self.maxsize:
+                if self.back_pressure is BackPressure.BLOCK:
+                    while len(self._entries) >= self.maxsize and not self._closed:
+                        self._condition.wait()
+                    if self._closed:
+                        return
+                elif self.back_pressure is BackPressure.DROP_NEWEST:
+                    self.dropped_chunks += 1
+                    self._dropped_pending += samples
+                    return
+                else:
+                    if not self._drop_oldest():
+                        # Only control entries queued: Drop the new chunk
+                        self.dropped_chunks += 1
+                        self._dropped_pending += samples
+                        return
+            entry.dropped_before = self._dropped_pending
+            self._dropped_pending = 0
+            self._entries.append(entry)
+            if len(self._entries) > self._depth_max:
+                self._depth_max = len(self._entries)
+            self._condition.notify_all()
+
+    def _drop_oldest(self) -> bool:
+        """
+        Drops the oldest entry which is not a control entry.
+        Returns False if there is none.
+        """
+        for i, oldest in enumerate(self._entries):
+            if oldest.control:
+                continue
+            del self._entries[i]
+            self.dropped_chunks += 1
+            dropped = oldest.dropped_before + oldest.samples
+            if i < len(self._entries):
+                self._entries[i].dropped_before += dropped
+            else:
+                self._dropped_pending += dropped
+            return True
+        return False
+
+    def get(self, timeout_s: float) -> typing.Optional[_Entry]:
+        """
+        Called by the processing thread.
+        Returns None after the timeout or if the queue was closed.
+        """
+        with self._condition:
+            if len(self._entries) == 0:
+                if self._closed:
+                    return None
+                self._condition.wait(timeout=timeout_s)
+                if len(self._entries) == 0:
+                    return None
+            entry = self._entries.popleft()
+            self._condition.notify_all()
+            return entry
+
+    def close(self) -> None:
+        """
+        Wakes up both threads: 'put()' does not block anymore and drops the chunks.
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
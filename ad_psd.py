@@ -0,0 +1,114 @@
+"""
+Streaming power spectral density (Welch) of 'IN_voltage'.
+
+The samples are fed chunk by chunk. Complete segments are transformed immediately
+and only the sum of the periodograms is kept: The memory is bounded by the segment length,
+not by the length of the capture.
+"""
+
+from __future__ import annotations
+import enum
+import typing
+
+import numpy as np
+
+from logging_utils import EnumMixin
+
+BATCH_SEGMENTS = 64
+"""
+Segments transformed in one call to 'np.fft.rfft': Bounds the temporary arrays.
+"""
+
+
+class PsdWindow(EnumMixin, enum.Enum):
+    HANN = "HANN"
+    BLACKMAN = "BLACKMAN"
+    RECTANGULAR = "RECTANGULAR"
+
+    def coefficients(self, samples: int) -> np.ndarray:
+        if self is PsdWindow.HANN:
+            return np.hanning(samples)
+        if self is PsdWindow.BLACKMAN:
+            return np.blackman(samples)
+        return np.ones(samples)
+
+
+class PsdAverage(EnumMixin, enum.Enum):
+    SHOT = "SHOT"
+    "Average over the segments of one shot"
+    CONTINUOUS = "CONTINUOUS"
+    "Average over all shots until a setting is changed"
+
+
+class WelchPsd:
+    """
+    The mean of every segment is removed before the window is applied.
+
+    >>> sps = 1000.0
+    >>> psd = WelchPsd(segment_samples=100, window=PsdWindow.HANN, overlap=0.5)
+    >>> noise = np.random.default_rng(0).normal(scale=0.1, size=100_000)
+    >>> for chunk in np.array_split(noise, 77):
+    ...     psd.feed(chunk)
+    >>> psd.segments
+    1999
+    >>> frequencies_Hz, density_V2_Hz = psd.density(sps=sps)
+    >>> frequencies_Hz[:3]
+    array([ 0., 10., 20.])
+    >>> # White noise: variance = density * bandwidth
+    >>> round(float(density_V2_Hz[5:-5].mean()) * sps / 2, 4)
+    0.01
+    """
+
+    def __init__(self, segment_samples: int, window: PsdWindow, overlap: float):
+        assert segment_samples >= 2, segment_samples
+        assert 0.0 <= overlap < 1.0, overlap
+        self.segment_samples = segment_samples
+        self.window = window
+        self.overlap = overlap
+        self._coefficients = window.coefficients(segment_samples)
+        self._step = max(1, segment_samples - int(round(overlap * segment_samples)))
+        self._carry = np.empty(0, dtype=np.float64)
+        self._sum = np.zeros(segment_samples // 2 + 1, dtype=np.float64)
+        self.segments = 0
+
+    def restart(self) -> None:
+        """
+        The next samples are not contiguous with the samples before (next segment of a multi shot).
+        The averages are kept.
+        """
+        self._carry = np.empty(0, dtype=np.float64)
+
+    def feed(self, chunk: np.ndarray) -> None:
+        samples = np.concatenate((self._carry, chunk.astype(np.float64, copy=False)))
+        count = 0
+        if len(samples) >= self.segment_samples:
+            count = (len(samples) - self.segment_samples) // self._step + 1
+        for first in range(0, count, BATCH_SEGMENTS):
+            n = min(BATCH_SEGMENTS, count - first)
+            segments = np.lib.stride_tricks.as_strided(
+                samples[first * self._step :],
+                shape=(n, self.segment_samples),
+                strides=(self._step * samples.strides[0], samples.strides[0]),
+                writeable=False,
+            )
+            detrended = segments - segments.mean(axis=1, keepdims=True)
+            spectra = np.fft.rfft(detrended * self._coefficients, axis=1)
+            self._sum += np.square(np.abs(spectra)).sum(axis=0)
+        self.segments += count
+        self._carry = samples[count * self._step :].copy()
+
+    def density(self, sps: float) -> typing.Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the frequencies in Hz and the one-sided density in V^2/Hz.
+        The density is empty if no segment was complete.
+        """
+        frequencies_Hz = np.fft.rfftfreq(self.segment_samples, d=1.0 / sps)
+        if self.segments == 0:
+            return frequencies_Hz, np.empty(0, dtype=np.float64)
+        scale = 1.0 / (sps * np.square(self._coefficients).sum() * self.segments)
+        density = self._sum * scale
+        # One-sided: The energy of the negative frequencies is added, except DC and Nyquist
+        density[1:] *= 2.0
+        if self.segment_samples % 2 == 0:
+            density[-1] /= 2.0
+        return frequencies_Hz, density
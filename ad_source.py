@@ -0,0 +1,299 @@
+"""
+Measurement sources which replace the pico behind 'AdThread'.
+
+'AdThread' uses a small subset of 'AdLowNoiseFloat2023'.
+The sources in this module implement this subset and deliver recorded or
+synthetic samples: This allows to load-test and profile the capture path without hardware.
+
+    thread = AdThread(ad=SyntheticSource(signal=SyntheticSignal(), realtime=True))
+"""
+
+from __future__ import annotations
+import time
+import typing
+import pathlib
+import logging
+import argparse
+import dataclasses
+
+import numpy as np
+
+from ad_low_noise_float_2023.ad import LOGGER_NAME
+from ad_low_noise_float_2023.constants import PcbParams, RegisterFilter1
+
+logger = logging.getLogger(LOGGER_NAME)
+
+LABBER_INSTRUMENT_NAME = "ad_low_noise_float_2023"
+
+
+@dataclasses.dataclass
+class SyntheticMeasurements:
+    """
+    Same attributes as 'ad_low_noise_float_2023.ad.MeasurementSequence'.
+    """
+
+    adc_value_V: np.ndarray
+    IN_disable: np.ndarray
+    IN_t: np.ndarray
+    errors: int = 0
+
+
+class _Decoder:
+    def size(self) -> int:
+        """
+        The samples are generated on request: There is never a backlog.
+        """
+        return 0
+
+
+class _PcbStatus:
+    gain_from_jumpers = 1.0
+
+    def list_errors(self, error_code: int, inclusive_status: bool) -> typing.List[str]:
+        return []
+
+
+class SourceBase:
+    """
+    The subset of 'AdLowNoiseFloat2023' used by 'AdThread'.
+    """
+
+    def __init__(
+        self,
+        chunk_samples: typing.Tuple[int, int] = (1000, 1000),
+        realtime: bool = False,
+        seed: int = 0,
+    ):
+        """
+        chunk_samples: Every chunk has a random size between these limits.
+        realtime: If True, the samples are delivered at the sample rate, else as fast as possible.
+        """
+        self.chunk_samples = chunk_samples
+        self.realtime = realtime
+        self.decoder = _Decoder()
+        self.pcb_status = _PcbStatus()
+        self.connected = False
+        self._rng = np.random.default_rng(seed)
+        self._sps = RegisterFilter1.SPS_97656.SPS
+        self._idx0 = 0
+
+    def connect(self, pcb_params: PcbParams) -> None:
+        self._sps = pcb_params.register_filter1.SPS
+        self.connected = True
+
+    def reconfigure(self, pcb_params: PcbParams) -> None:
+        """
+        Change the SPS over the open link: See 'AdThread._connect()'.
+        """
+        assert self.connected
+        self._sps = pcb_params.register_filter1.SPS
+
+    def close(self) -> None:
+        self.connected = False
+
+    def _generate(
+        self, idx0: int, samples: int
+    ) -> typing.Optional[SyntheticMeasurements]:
+        """
+        Returns the samples 'idx0' to 'idx0+samples'.
+        Returns None at the end of the data.
+        """
+        raise NotImplementedError()
+
+    def iter_measurements_V(
+        self, pcb_params: PcbParams, do_connect: bool = True
+    ) -> typing.Iterator[SyntheticMeasurements]:
+        if do_connect:
+            self.connect(pcb_params=pcb_params)
+        begin_s = time.monotonic()
+        idx0_begin = self._idx0
+        while self.connected:
+            samples = int(
+                self._rng.integers(self.chunk_samples[0], self.chunk_samples[1] + 1)
+            )
+            measurements = self._generate(idx0=self._idx0, samples=samples)
+            if measurements is None:
+                return
+            self._idx0 += len(measurements.adc_value_V)
+            if self.realtime:
+                delay_s = (
+                    begin_s + (self._idx0 - idx0_begin) / self._sps - time.monotonic()
+                )
+                if delay_s > 0.0:
+                    time.sleep(delay_s)
+            yield measurements
+
+
+@dataclasses.dataclass
+class SyntheticSignal:
+    """
+    A periodic enable pulse.
+    All times are relative to the begin of the period.
+    """
+
+    period_s: float = 1.0
+    enable_start_s: float = 0.1
+    "Falling edge of 'IN_disable'"
+    enable_s: float = 0.5
+    "Duration of the enable pulse"
+    t_start_s: float = 0.2
+    "Raising edge of 'IN_t'"
+    t_s: float = 0.1
+    "Duration of the 'IN_t' pulse"
+    voltage_disabled_V: float = 0.0
+    voltage_enabled_V: float = 0.7
+    noise_V: float = 1e-5
+
+
+class SyntheticSource(SourceBase):
+    def __init__(self, signal: SyntheticSignal, **kwargs):
+        super().__init__(**kwargs)
+        self.signal = signal
+
+    def _generate(self, idx0: int, samples: int) -> SyntheticMeasurements:
+        signal = self.signal
+        t_s = np.arange(idx0, idx0 + samples) / self._sps % signal.period_s
+        enabled = (t_s >= signal.enable_start_s) & (
+            t_s < signal.enable_start_s + signal.enable_s
+        )
+        adc_value_V = np.where(
+            enabled, signal.voltage_enabled_V, signal.voltage_disabled_V
+        )
+        if signal.noise_V > 0.0:
+            adc_value_V = adc_value_V + self._rng.normal(
+                scale=signal.noise_V, size=samples
+            )
+        return SyntheticMeasurements(
+            adc_value_V=adc_value_V,
+            IN_disable=~enabled,
+            IN_t=(t_s >= signal.t_start_s) & (t_s < signal.t_start_s + signal.t_s),
+        )
+
+
+class ArraySource(SourceBase):
+    """
+    Replays arrays of samples.
+    """
+
+    def __init__(
+        self,
+        IN_voltage: np.ndarray,
+        IN_disable: np.ndarray,
+        IN_t: np.ndarray,
+        loop: bool = True,
+        **kwargs,
+    ):
+        super().__init__(**kwargs)
+        assert len(IN_voltage) == len(IN_disable) == len(IN_t)
+        assert len(IN_voltage) > 0
+        self.IN_voltage = IN_voltage
+        self.IN_disable = IN_disable.astype(bool)
+        self.IN_t = IN_t.astype(bool)
+        self.loop = loop
+
+    def _generate(
+        self, idx0: int, samples: int
+    ) -> typing.Optional[SyntheticMeasurements]:
+        size = len(self.IN_voltage)
+        if not self.loop:
+            if idx0 >= size:
+                return None
+            indices = np.arange(idx0, min(idx0 + samples, size))
+        else:
+            indices = np.arange(idx0, idx0 + samples) % size
+        return SyntheticMeasurements(
+            adc_value_V=self.IN_voltage[indices],
+            IN_disable=self.IN_disable[indices],
+            IN_t=self.IN_t[indices],
+        )
+
+    @staticmethod
+    def from_labber_hdf5(
+        filename: pathlib.Path, gap_s: float = 0.1, **kwargs
+    ) -> ArraySource:
+        """
+        Replays all traces 'IN_voltage', 'IN_disable' and 'IN_t' from a Labber log file
+        like 'tests_config/Data/measurement_SPS_03052.hdf5'.
+        The traces are separated by 'gap_s' of samples with 'IN_disable' set.
+        The data is replayed at the sample rate configured by 'sample_rate_SPS',
+        not at the sample rate of the recording.
+        """
+        try:
+            import h5py  # pylint: disable=import-outside-toplevel
+        except ModuleNotFoundError as e:
+            raise Exception(
+                'The module "h5py" is missing. Did you call "pip install -r requirements_dev.txt"?'
+            ) from e
+
+        def trace_name(label: str) -> str:
+            return f"{LABBER_INSTRUMENT_NAME} - {label}"
+
+        channels: typing.Dict[str, typing.List[np.ndarray]] = {
+            "IN_voltage": [],
+            "IN_disable": [],
+            "IN_t": [],
+        }
+        with h5py.File(filename, "r") as f:
+            traces = f["Traces"]
+            _t0, dt_s = traces[trace_name("IN_voltage") + "_t0dt"][0]
+            gap_samples = max(1, int(gap_s / dt_s))
+            for label, arrays in channels.items():
+                data = traces[trace_name(label)]
+                lengths = traces[trace_name(label) + "_N"][:]
+                for entry, length in enumerate(lengths):
+                    trace = data[:length, 0, entry]
+                    # Between the traces: 'IN_disable' set, other channels keep their value
+                    gap_value = 1.0 if label == "IN_disable" else trace[-1]
+                    arrays.append(trace)
+                    arrays.append(np.full(gap_samples, gap_value))
+        logger.info(
+            f"{filename.name}: {len(channels['IN_voltage'])//2} traces, recorded at {1.0/dt_s:0.0f}SPS"
+        )
+        return ArraySource(
+            IN_voltage=np.concatenate(channels["IN_voltage"]),
+            IN_disable=np.concatenate(channels["IN_disable"]),
+            IN_t=np.concatenate(channels["IN_t"]),
+            **kwargs,
+        )
+
+
+def main_replay():
+    """
+    Run 'AdThread' against a source and print the results of some shots.
+    """
+    import ad_thread  # pylint: disable=import-outside-toplevel
+
+    parser = argparse.ArgumentParser(description=main_replay.__doc__)
+    parser.add_argument(
+        "--hdf5",
+        type=pathlib.Path,
+        default=None,
+        help="Replay a Labber log file. Default: A synthetic signal.",
+    )
+    parser.add_argument("--shots", type=int, default=5)
+    parser.add_argument("--realtime", action="store_true")
+    args = parser.parse_args()
+
+    logging.basicConfig()
+    if args.hdf5 is None:
+        source = SyntheticSource(signal=SyntheticSignal(), realtime=args.realtime)
+    else:
+        source = ArraySource.from_labber_hdf5(
+            filename=args.hdf5, realtime=args.realtime
+        )
+
+    thread = ad_thread.AdThread(ad=source)
+    thread.start()
+    thread.wait_startup()
+    for _ in range(args.shots):
+        begin_s = time.monotonic()
+        thread.wait_measurements()
+        result = thread._aquisition.result
+        print(
+            f"{time.monotonic()-begin_s:6.3f}s: shot {result.shot_id} timeout_detected={result.timeout_detected} enable_start_s={result.enable_start_s:0.4f}s enable_s={result.enable_s:0.4f}s"
+        )
+    thread.stop()
+
+
+if __name__ == "__main__":
+    main_replay()
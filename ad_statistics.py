@@ -0,0 +1,86 @@
+"""
+Statistics of 'IN_voltage' over the enable window, accumulated chunk by chunk while capturing.
+
+A step which only needs mean, noise, min/max or the integral does not have to transfer the trace.
+"""
+
+from __future__ import annotations
+import math
+import enum
+import dataclasses
+
+import numpy as np
+
+from logging_utils import EnumMixin
+
+
+class StatisticsWindow(EnumMixin, enum.Enum):
+    ENABLE = "ENABLE"
+    "All samples between the falling and the raising edge of 'IN_disable'"
+    ENABLE_AND_IN_T = "ENABLE_AND_IN_T"
+    "Only the samples of the enable window where 'IN_t' is set"
+
+
+@dataclasses.dataclass(frozen=True)
+class Statistics:
+    samples: int = 0
+    mean_V: float = math.nan
+    std_V: float = math.nan
+    rms_V: float = math.nan
+    min_V: float = math.nan
+    max_V: float = math.nan
+    integral_Vs: float = 0.0
+
+
+class RunningStatistics:
+    """
+    Every chunk is reduced with numpy and merged with the chunks before
+    (Welford, parallel variant by Chan et al.): Numerically stable, no samples are kept.
+
+    >>> statistics = RunningStatistics()
+    >>> statistics.feed(np.array([1.0, 2.0, 3.0]))
+    >>> statistics.feed(np.array([4.0]))
+    >>> statistics.result(dt_s=0.5)
+    Statistics(samples=4, mean_V=2.5, std_V=1.118033988749895, rms_V=2.7386127875258306, min_V=1.0, max_V=4.0, integral_Vs=5.0)
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        "Sum of the squared differences from the mean"
+        self.min = math.inf
+        self.max = -math.inf
+        self.sum = 0.0
+
+    def feed(self, values: np.ndarray) -> None:
+        count = len(values)
+        if count == 0:
+            return
+        mean = float(values.mean())
+        m2 = float(np.square(values - mean).sum())
+        count_total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / count_total
+        self.m2 += m2 + delta**2 * self.count * count / count_total
+        self.count = count_total
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        self.sum += mean * count
+
+    def result(self, dt_s: float) -> Statistics:
+        """
+        The standard deviation is the population standard deviation (noise of the samples).
+        """
+        if self.count == 0:
+            return Statistics()
+        variance = self.m2 / self.count
+        return Statistics(
+            samples=self.count,
+            mean_V=self.mean,
+            std_V=math.sqrt(variance),
+            rms_V=math.sqrt(variance + self.mean**2),
+            min_V=self.min,
+            max_V=self.max,
+            integral_Vs=self.sum * dt_s,
+        )
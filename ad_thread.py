@@ -3,6 +3,8 @@ import time
 import enum
 import logging
 import threading
+import pathlib
+import functools
 import dataclasses
 import typing
 
@@ -14,7 +16,36 @@ from ad_low_noise_float_2023.ad import (
     MeasurementSequence,
 )
 from ad_low_noise_float_2023.constants import PcbParams, RegisterFilter1, AD_FS_V
-from ad_utils import CHANNEL_VOLTAGE, CHANNEL_T, CHANNEL_DISABLE
+from ad_utils import (
+    CHANNEL_VOLTAGE,
+    CHANNEL_T,
+    CHANNEL_DISABLE,
+    CHANNEL_VOLTAGE_CROSSINGS,
+    CHANNEL_T_EDGES,
+    CHANNEL_PSD,
+    LazyArray,
+    materialize,
+)
+from logging_utils import ChunkSummary, EnumMixin, PhaseTimer
+from ad_metrics import Metrics, TimedLock
+from ad_pipeline import BackPressure, ChunkQueue
+from ad_continuity import ContinuityChecker, Gap, SampleLossPolicy
+from ad_timing import Direction, Interpolation, threshold_crossings, digital_edges
+from ad_statistics import RunningStatistics, Statistics, StatisticsWindow
+from ad_psd import WelchPsd, PsdWindow, PsdAverage
+from ad_decimation import DecimationMode, decimate, decimated_dt_s
+from ad_capture import (
+    GrowableArray,
+    MemmapArray,
+    DigitalArray,
+    EdgeDetector,
+    RingBuffer,
+    DEFAULT_CAPACITY_SAMPLES,
+    PROGRESS_INTERVAL_S,
+    SHOT_DIRECTORIES_KEEP,
+    create_shot_directory,
+    save_shot_info,
+)
 
 ADD_PRE_POST_SAMPLE = True
 """
@@ -24,9 +55,27 @@ If not set, IN_disable looks very boring... (all samples are 0)
 
 TODO_REMOVE = False
 
+STARTUP_TIMEOUT_S = 60.0
+STARTUP_MESSAGE_S = 5.0
+"Interval of the 'Waiting to be connected...' messages"
+
+SAMPLE_LOSS_RETRIES = 3
+"See 'SampleLossPolicy.RETRY'"
+
+STATISTICS_PREFIX = "statistics_"
+"""
+The quantity 'statistics_mean_V' returns 'mean_V' of 'ShotResult.statistics'.
+"""
+
+METRICS_PREFIX = "metrics_"
+"""
+The quantity 'metrics_chunks_per_s' returns 'chunks_per_s' of 'Metrics.snapshot'.
+"""
+
 logger = logging.getLogger(LOGGER_NAME)
 
-LOCK = threading.Lock()
+LOCK = TimedLock()
+"The hold times are reported in 'AdThread.metrics'."
 
 
 class State(enum.IntEnum):
@@ -46,25 +95,87 @@ def synchronized(func):
     return wrapper
 
 
-@dataclasses.dataclass
 class Capturer:
-    IN_voltage: list[np.array]
-    IN_disable: list[np.array]
-    IN_t: list[np.array]
+    """
+    Stores the samples of one shot.
 
-    def append(self, measurements: MeasurementSequence) -> None:
-        self.IN_voltage = np.concatenate((self.IN_voltage, measurements.adc_value_V))
-        self.IN_disable = np.concatenate((self.IN_disable, measurements.IN_disable))
-        self.IN_t = np.concatenate((self.IN_t, measurements.IN_t))
+    The arrays are preallocated and the chunks are written in place.
+    'IN_voltage' is a view (no copy) into this array.
 
-    def stop(self, measurements: MeasurementSequence, idx0_end: int) -> None:
-        self.IN_voltage = np.concatenate(
-            (self.IN_voltage, measurements.adc_value_V[:idx0_end])
+    'IN_disable' and 'IN_t' change only a few times per shot:
+    They are stored as transitions and expanded only on request.
+    """
+
+    def __init__(
+        self,
+        capacity: int = DEFAULT_CAPACITY_SAMPLES,
+        shot_directory: typing.Optional[pathlib.Path] = None,
+    ):
+        """
+        If 'shot_directory' is given, the samples are written to memory mapped files.
+        """
+        self.shot_directory = shot_directory
+
+        if shot_directory is None:
+            self._IN_voltage = GrowableArray(capacity=capacity)
+        else:
+            self._IN_voltage = MemmapArray(
+                filename=shot_directory / f"{CHANNEL_VOLTAGE.label}.npy",
+                capacity=capacity,
+            )
+        self._IN_disable = DigitalArray()
+        self._IN_t = DigitalArray()
+        self._begin = 0
+        self._end = 0
+        self._progress_s = time.monotonic()
+        "time of the last 'save_progress()'"
+
+    @property
+    def IN_voltage(self) -> np.ndarray:
+        return self._IN_voltage.view(self._begin, self._end)
+
+    @property
+    def samples(self) -> int:
+        return self._end - self._begin
+
+    @property
+    def IN_disable(self) -> np.ndarray:
+        return self._IN_disable.view(self._begin, self._end)
+
+    def lazy_IN_disable(self) -> LazyArray:
+        return functools.partial(self._IN_disable.view, self._begin, self._end)
+
+    def lazy_IN_t(self) -> LazyArray:
+        return functools.partial(self._IN_t.view, self._begin, self._end)
+
+    @property
+    def IN_t(self) -> np.ndarray:
+        return self._IN_t.view(self._begin, self._end)
+
+    def _append(
+        self,
+        adc_value_V: np.ndarray,
+        IN_disable: np.ndarray,
+        IN_t: np.ndarray,
+    ) -> None:
+        self._IN_voltage.append(adc_value_V)
+        self._IN_disable.append(IN_disable)
+        self._IN_t.append(IN_t)
+        self._end = self._IN_voltage.size
+
+    def append(self, measurements: MeasurementSequence, idx0_begin: int = 0) -> None:
+        self._append(
+            adc_value_V=measurements.adc_value_V[idx0_begin:],
+            IN_disable=measurements.IN_disable[idx0_begin:],
+            IN_t=measurements.IN_t[idx0_begin:],
         )
-        self.IN_disable = np.concatenate(
-            (self.IN_disable, measurements.IN_disable[:idx0_end])
+
+    def stop(self, measurements: MeasurementSequence, idx0_end: int) -> None:
+        self._append(
+            adc_value_V=measurements.adc_value_V[:idx0_end],
+            IN_disable=measurements.IN_disable[:idx0_end],
+            IN_t=measurements.IN_t[:idx0_end],
         )
-        self.IN_t = np.concatenate((self.IN_t, measurements.IN_t[:idx0_end]))
 
         assert len(self.IN_voltage) == len(self.IN_disable)
         assert len(self.IN_voltage) == len(self.IN_t)
@@ -83,53 +194,245 @@ class Capturer:
         value_to_find: int,
     ) -> typing.Optional[int]:
         """
-        Returns the index of the first '0'.
-        Returns None if no '0' found.
+        Returns the index of the first 'value_to_find'.
+        Returns None if not found.
+        """
+        return EdgeDetector().find_first(
+            array_of_bool=array_of_bool, value_to_find=value_to_find
+        )
 
-        import numpy as np
-        >>> high_low_high = np.array([1, 1, 0, 0, 1], bool)
-        >>> low = np.nonzero(high_low_high == 0)[0]
-        >>> low
-        array([2, 3])
-        >>> low[0]
-        2
+    @property
+    def begin(self) -> int:
         """
-        if TODO_REMOVE:
-            logger.info(
-                f"TOBE REMOVE find_first({len(array_of_bool)} value_to_find={value_to_find})"
-            )
-        if len(array_of_bool) == 0:
-            if TODO_REMOVE:
-                logger.info(
-                    f"TOBE REMOVE find_first({len(array_of_bool)}) value_to_find={value_to_find}) A"
-                )
-            return None
+        Index of 'IN_xx[0]' in 'IN_disable_all'.
+        """
+        return self._begin
 
-        # Find first '0'
-        array_nonzero = np.nonzero(array_of_bool == value_to_find)[0]
-        if len(array_nonzero) == 0:
-            if TODO_REMOVE:
-                logger.info(
-                    f"TOBE REMOVE find_first({len(array_of_bool)}) value_to_find={value_to_find}) B"
-                )
-            return None
+    @property
+    def IN_disable_all(self) -> DigitalArray:
+        """
+        All samples captured, ignoring 'limit_begin()' and 'limit_end()'.
+        """
+        return self._IN_disable
 
-        idx0_first = int(array_nonzero[0])
-        if TODO_REMOVE:
-            logger.info(
-                f"TOBE REMOVE find_first({len(array_of_bool)}) value_to_find={value_to_find}) C idx0_first0={idx0_first}"
-            )
-        return idx0_first
+    @property
+    def IN_t_all(self) -> DigitalArray:
+        return self._IN_t
+
+    @property
+    def size_all(self) -> int:
+        return self._IN_voltage.size
+
+    def IN_voltage_all(self, begin: int, end: int) -> np.ndarray:
+        """
+        Same indices as 'IN_disable_all'.
+        """
+        return self._IN_voltage.view(begin, end)
 
     def limit_begin(self, idx0: int) -> None:
-        self.IN_disable = self.IN_disable[idx0:]
-        self.IN_t = self.IN_t[idx0:]
-        self.IN_voltage = self.IN_voltage[idx0:]
+        self._begin += idx0
+
+    def save_info(self, info: dict) -> None:
+        """
+        Write 'shot.json' next to the memory mapped files.
+        """
+        if self.shot_directory is None:
+            return
+        self._IN_voltage.flush()
+        info = dict(info)
+        info["begin"] = self._begin
+        info["end"] = self._end
+        info["files"] = [self._IN_voltage.filename.name]
+        for label, digital in (
+            (CHANNEL_DISABLE.label, self._IN_disable),
+            (CHANNEL_T.label, self._IN_t),
+        ):
+            info[label] = digital.save(self.shot_directory / f"{label}_transitions.npy")
+        save_shot_info(shot_directory=self.shot_directory, info=info)
+
+    def save_progress(self, info: typing.Callable[[], dict]) -> None:
+        """
+        Called for every chunk while capturing.
+        At most every 'PROGRESS_INTERVAL_S': Write 'shot.json' with the samples captured so far.
+        """
+        if self.shot_directory is None:
+            return
+        now_s = time.monotonic()
+        if now_s - self._progress_s < PROGRESS_INTERVAL_S:
+            return
+        self._progress_s = now_s
+        self.save_info(info=info())
+
+    def restart(self, idx0_all: int) -> None:
+        """
+        Drop all samples before 'idx0_all' and remove the limits.
+        The samples after 'idx0_all' become the beginning of the next capture.
+        """
+        self._IN_voltage.discard_begin(idx0_all)
+        self._IN_disable.discard_begin(idx0_all)
+        self._IN_t.discard_begin(idx0_all)
+        self._begin = 0
+        self._end = self._IN_voltage.size
 
     def limit_end(self, idx0: int) -> None:
-        self.IN_disable = self.IN_disable[:idx0]
-        self.IN_t = self.IN_t[:idx0]
-        self.IN_voltage = self.IN_voltage[:idx0]
+        self._end = min(self._begin + idx0, self._IN_voltage.size)
+
+
+class Pretrigger:
+    """
+    Keeps the last samples while 'ARMED'.
+    When the capturing starts, the capture is prepended with these samples.
+    """
+
+    def __init__(self, capacity: int = 0):
+        self._IN_voltage = RingBuffer(capacity=capacity)
+        self._IN_disable = RingBuffer(capacity=capacity)
+        self._IN_t = RingBuffer(capacity=capacity)
+
+    @property
+    def capacity(self) -> int:
+        return self._IN_voltage.capacity
+
+    @property
+    def size(self) -> int:
+        return self._IN_voltage.size
+
+    def clear(self) -> None:
+        self._IN_voltage.clear()
+        self._IN_disable.clear()
+        self._IN_t.clear()
+
+    def append(self, measurements: MeasurementSequence) -> None:
+        self._IN_voltage.write(measurements.adc_value_V)
+        self._IN_disable.write(measurements.IN_disable)
+        self._IN_t.write(measurements.IN_t)
+
+    def copy_to(self, capturer: Capturer) -> None:
+        for IN_voltage, IN_disable, IN_t in zip(
+            self._IN_voltage.views(),
+            self._IN_disable.views(),
+            self._IN_t.views(),
+        ):
+            capturer._append(adc_value_V=IN_voltage, IN_disable=IN_disable, IN_t=IN_t)
+
+
+class ShotsMode(EnumMixin, enum.Enum):
+    CONCATENATE = "CONCATENATE"
+    AVERAGE = "AVERAGE"
+
+
+class Segments:
+    """
+    The segments of a multi shot acquisition, aligned on the falling edge.
+
+    The memory does not depend on the worst case 'shots' times 'samples':
+    'average' sums up the segments in one row per channel,
+    else a copy of every segment is kept with its actual length.
+    """
+
+    def __init__(self, shots: int, samples: int, average: bool):
+        self.shots = shots
+        self.samples = samples
+        "The maximal length of a segment"
+        self.average_only = average
+        self._sums: typing.Optional[typing.List[np.ndarray]] = None
+        "average: The sum of the segments per channel"
+        self._copies: typing.List[typing.Tuple[np.ndarray, np.ndarray, np.ndarray]] = []
+        "not average: The segments"
+        self.lengths = np.zeros(shots, dtype=np.int64)
+        self.timeout_detected = np.zeros(shots, dtype=bool)
+        self.enable_start_detected = np.zeros(shots, dtype=bool)
+        self.enable_end_detected = np.zeros(shots, dtype=bool)
+        self.enable_start_s = np.zeros(shots)
+        self.enable_s = np.zeros(shots)
+        self.count = 0
+
+    @property
+    def full(self) -> bool:
+        return self.count >= self.shots
+
+    def clear(self) -> None:
+        self.count = 0
+        self._copies = []
+        if self._sums is not None:
+            for array in self._sums:
+                array.fill(0.0)
+
+    def append(self, acquisition: Acquistion) -> None:
+        capturer = acquisition.capturer
+        i = self.count
+        n = min(len(capturer.IN_voltage), self.samples)
+        channels = (
+            capturer.IN_voltage[:n],
+            capturer.IN_disable[:n],
+            capturer.IN_t[:n],
+        )
+        if self.average_only:
+            if self._sums is None:
+                self._sums = [np.zeros(self.samples) for _ in channels]
+            for array_sum, array in zip(self._sums, channels):
+                array_sum[:n] += array
+        else:
+            self._copies.append(tuple(array.copy() for array in channels))
+        self.lengths[i] = n
+        self.timeout_detected[i] = acquisition.timeout_detected
+        self.enable_start_detected[i] = acquisition.enable_start_detected
+        self.enable_end_detected[i] = acquisition.enable_end_detected
+        self.enable_start_s[i] = acquisition.enable_start_s
+        self.enable_s[i] = acquisition.enable_s
+        self.count += 1
+
+    def concatenate(self) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns IN_voltage, IN_disable, IN_t: All segments one after the other.
+        """
+        assert not self.average_only
+        return tuple(
+            np.concatenate([copy[channel] for copy in self._copies])
+            for channel in range(3)
+        )
+
+    def average(self) -> typing.Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns IN_voltage, IN_disable, IN_t: The average over all segments.
+        The length is the length of the shortest segment.
+        """
+        assert self.average_only
+        n = int(self.lengths[: self.count].min())
+        return tuple(array_sum[:n] / self.count for array_sum in self._sums)
+
+
+@dataclasses.dataclass(frozen=True)
+class ShotResult:
+    """
+    The result of a shot as read by Labber.
+
+    A new instance is created for every shot and published by replacing 'Acquistion.result'.
+    The acquisition thread builds the next result while Labber reads the published one:
+    The Labber thread never has to wait for a capture in flight.
+    """
+
+    shot_id: int = 0
+    "Incremented for every shot. 0: No shot captured yet."
+    sps: float = 1.0
+    timeout_detected: bool = False
+    enable_start_detected: bool = False
+    enable_end_detected: bool = False
+    enable_start_s: float = 0.0
+    enable_s: float = 0.0
+    shots_captured: int = 0
+    samples_lost: int = 0
+    "Estimated. See 'gaps'."
+    gaps: typing.Tuple[Gap, ...] = ()
+    "Samples lost during this shot"
+    statistics: Statistics = dataclasses.field(default_factory=Statistics)
+    psd_V2_Hz: np.ndarray = dataclasses.field(default_factory=lambda: np.array([]))
+    "Power spectral density of 'IN_voltage' over the enable window"
+    psd_df_Hz: float = 1.0
+    "Frequency resolution of 'psd_V2_Hz', the first frequency is 0 Hz"
+    IN_voltage: LazyArray = dataclasses.field(default_factory=lambda: np.array([]))
+    IN_disable: LazyArray = dataclasses.field(default_factory=lambda: np.array([]))
+    IN_t: LazyArray = dataclasses.field(default_factory=lambda: np.array([]))
 
 
 @dataclasses.dataclass
@@ -137,8 +440,14 @@ class Acquistion:
     state: State = State.ARMED
     capturer: typing.Optional[Capturer] = None
     time_armed_start_s: float = time.monotonic()
-    done_event = threading.Event()
-    lock = threading.Lock()
+    done_event: threading.Event = dataclasses.field(default_factory=threading.Event)
+    lock: threading.Lock = dataclasses.field(default_factory=threading.Lock)
+    """
+    Guards the state transitions only.
+    The results are published in 'result' which may be read without lock.
+    """
+    _exception: typing.Optional[Exception] = None
+    "Set by 'abort()': No shot will be completed anymore."
     _sps: float = 1.0
     timeout_detected: bool = False
     enable_start_detected: bool = False
@@ -147,16 +456,68 @@ class Acquistion:
     enable_s: float = 0.0
     _duration_max_s = 4.2
     _duration_max_sample = 42
-    _IN_disable_first_measurement = 1
     idx0_start_capturing: int = 0
+    _edge_detector: EdgeDetector = dataclasses.field(default_factory=EdgeDetector)
+    _pretrigger_s = 0.0
+    _pretrigger: Pretrigger = dataclasses.field(default_factory=Pretrigger)
+    _idx0_arm: int = 0
+    """
+    Index of the first sample after the arm point: The samples before are pretrigger samples.
+    """
+    _idx0_next_segment: int = 0
+    _append_summary: ChunkSummary = dataclasses.field(
+        default_factory=lambda: ChunkSummary(logger, name="CAPTURING append")
+    )
+    "The chunks are logged once per second and not one by one."
+    shots_per_read: int = 1
+    shots_mode: ShotsMode = ShotsMode.CONCATENATE
+    statistics_window: StatisticsWindow = StatisticsWindow.ENABLE
+    _statistics: RunningStatistics = dataclasses.field(
+        default_factory=RunningStatistics
+    )
+    "Over all segments of the shot"
+    _idx0_window: typing.Optional[int] = None
+    """
+    Index in 'IN_disable_all' of the next sample of the enable window
+    to be fed into '_statistics' and '_psd'.
+    None before the falling edge.
+    """
+    psd_segment_samples: int = 0
+    "0: The PSD is not calculated"
+    psd_window: PsdWindow = PsdWindow.HANN
+    psd_overlap: float = 0.5
+    psd_average: PsdAverage = PsdAverage.SHOT
+    _psd: typing.Optional[WelchPsd] = None
+    _psd_settings: typing.Optional[tuple] = None
+    "The settings '_psd' was created with"
+    _segments: typing.Optional[Segments] = None
+    capture_directory: typing.Optional[pathlib.Path] = None
+    "If set, the samples are written to memory mapped files in this directory."
+    capture_keep_shots: int = SHOT_DIRECTORIES_KEEP
+    "The number of shot directories kept in 'capture_directory'. 0: All"
+    result: ShotResult = dataclasses.field(default_factory=ShotResult)
+    "The last shot. Replaced as a whole when the next shot is done."
+    _result_next: typing.Optional[ShotResult] = None
+    _gaps: typing.List[Gap] = dataclasses.field(default_factory=list)
 
     def set_SPS(self, register_filter1: RegisterFilter1) -> None:
+        """
+        Called after every (re)connect: The samples before are not contiguous with the samples to come.
+        """
         assert isinstance(register_filter1, RegisterFilter1)
         self._sps = register_filter1.SPS
         self._update_sps()
+        with self.lock:
+            self._pretrigger.clear()
+            # The spectra of different sample rates may not be averaged
+            self._psd = None
 
     def _update_sps(self) -> None:
         self._duration_max_sample = int(self._duration_max_s * self._sps)
+        pretrigger_sample = int(self._pretrigger_s * self._sps)
+        if pretrigger_sample != self._pretrigger.capacity:
+            with self.lock:
+                self._pretrigger = Pretrigger(capacity=pretrigger_sample)
 
     @property
     def duration_max_s(self) -> int:
@@ -167,46 +528,255 @@ class Acquistion:
         self._duration_max_s = value
         self._update_sps()
 
+    @property
+    def pretrigger_s(self) -> float:
+        return self._pretrigger_s
+
+    @pretrigger_s.setter
+    def pretrigger_s(self, value: float) -> None:
+        self._pretrigger_s = value
+        self._update_sps()
+
     def _done(self) -> None:
+        assert self._result_next is not None
+        self.result = self._result_next
+        self._result_next = None
         self.done_event.set()
         self.state = State.ARMED
+        # The pretrigger samples have to be contiguous with the next capture
+        self._pretrigger.clear()
+
+    def _reset_segment(self) -> None:
+        self.timeout_detected = False
+        self.enable_start_detected = False
+        self.enable_end_detected = False
+        self.enable_start_s = 0.0
+        self.enable_s = 0.0
+        self._idx0_arm = 0
+        self._edge_detector = EdgeDetector()
+        self._idx0_window = None
+        if self._psd is not None:
+            self._psd.restart()
+
+    def _prepare_segments(self) -> None:
+        if self.shots_per_read <= 1:
+            self._segments = None
+            return
+        samples = self._pretrigger.capacity + self._duration_max_sample + 1
+        average = self.shots_mode is ShotsMode.AVERAGE
+        if self._segments is not None:
+            if (
+                self._segments.shots,
+                self._segments.samples,
+                self._segments.average_only,
+            ) == (self.shots_per_read, samples, average):
+                # Reuse the sums: The results are copied out.
+                self._segments.clear()
+                return
+        self._segments = Segments(
+            shots=self.shots_per_read, samples=samples, average=average
+        )
+
+    def _prepare_psd(self) -> None:
+        if self.psd_segment_samples < 2:
+            self._psd = None
+            return
+        settings = (
+            self.psd_segment_samples,
+            self.psd_window,
+            self.psd_overlap,
+            self.psd_average,
+        )
+        if (
+            (self._psd is not None)
+            and (self.psd_average is PsdAverage.CONTINUOUS)
+            and (settings == self._psd_settings)
+        ):
+            # Continue averaging
+            self._psd.restart()
+            return
+        self._psd = WelchPsd(
+            segment_samples=self.psd_segment_samples,
+            window=self.psd_window,
+            overlap=self.psd_overlap,
+        )
+        self._psd_settings = settings
+
+    def _shot_info(self, complete: bool = False) -> dict:
+        """
+        The content of 'shot.json'.
+        complete=False: A progress record written while capturing.
+        """
+        return dict(
+            complete=complete,
+            sps=self._sps,
+            timeout_detected=self.timeout_detected,
+            enable_start_detected=self.enable_start_detected,
+            enable_end_detected=self.enable_end_detected,
+            enable_start_s=self.enable_start_s,
+            enable_s=self.enable_s,
+            gaps=[dataclasses.asdict(gap) for gap in self._gaps],
+        )
 
-    def wait_for_acquisition(self, idx0_start_capturing: int) -> None:
+    def _finish(self) -> None:
+        """
+        Called when the last segment was captured.
+        Prepare the results to be published by '_done()'.
+        """
+        self.capturer.save_info(info=self._shot_info(complete=True))
+        shot_id = self.result.shot_id + 1
+        gaps = tuple(self._gaps)
+        samples_lost = sum(gap.samples for gap in gaps)
+        statistics = self._statistics.result(dt_s=1.0 / self._sps)
+        psd_V2_Hz = np.array([])
+        psd_df_Hz = 1.0
+        if self._psd is not None:
+            frequencies_Hz, psd_V2_Hz = self._psd.density(sps=self._sps)
+            psd_df_Hz = float(frequencies_Hz[1])
+        if self._segments is None:
+            self._result_next = ShotResult(
+                shot_id=shot_id,
+                sps=self._sps,
+                timeout_detected=self.timeout_detected,
+                enable_start_detected=self.enable_start_detected,
+                enable_end_detected=self.enable_end_detected,
+                enable_start_s=self.enable_start_s,
+                enable_s=self.enable_s,
+                shots_captured=1,
+                samples_lost=samples_lost,
+                gaps=gaps,
+                statistics=statistics,
+                psd_V2_Hz=psd_V2_Hz,
+                psd_df_Hz=psd_df_Hz,
+                IN_voltage=self.capturer.IN_voltage,
+                IN_disable=self.capturer.lazy_IN_disable(),
+                IN_t=self.capturer.lazy_IN_t(),
+            )
+            return
+
+        segments = self._segments
+        if segments.average_only:
+            IN_voltage, IN_disable, IN_t = segments.average()
+        else:
+            IN_voltage, IN_disable, IN_t = segments.concatenate()
+        self._result_next = ShotResult(
+            shot_id=shot_id,
+            sps=self._sps,
+            timeout_detected=bool(segments.timeout_detected.any()),
+            enable_start_detected=bool(segments.enable_start_detected.all()),
+            enable_end_detected=bool(segments.enable_end_detected.all()),
+            enable_start_s=float(segments.enable_start_s[0]),
+            enable_s=float(segments.enable_s.mean()),
+            shots_captured=segments.count,
+            samples_lost=samples_lost,
+            gaps=gaps,
+            statistics=statistics,
+            psd_V2_Hz=psd_V2_Hz,
+            psd_df_Hz=psd_df_Hz,
+            IN_voltage=IN_voltage,
+            IN_disable=IN_disable,
+            IN_t=IN_t,
+        )
+
+    def wait_for_acquisition(self, idx0_start_capturing: int) -> ShotResult:
         """
         We capture a new shot.
         Reset the last shot and get ready.
+        Blocks until the shot is done: No lock is held while waiting.
         """
         with self.lock:
+            self._raise_if_aborted()
             self.capturer = None
-            self.timeout_detected = False
-            self.enable_start_detected = False
-            self.enable_end_detected = False
-            self.enable_start_s = 0.0
-            self.enable_s = 0.0
+            self._reset_segment()
+            self._prepare_segments()
             self.time_armed_start_s: float = time.monotonic()
             self.state = State.CAPTURING
             self.idx0_start_capturing = idx0_start_capturing
+            self._gaps.clear()
+            self._statistics = RunningStatistics()
+            self._prepare_psd()
             self.done_event.clear()
         self.done_event.wait()
+        self._raise_if_aborted()
 
-        logger.info(f"    {len(self.capturer.IN_voltage)}samples")
-        logger.info(f"    {self._sps:0.0f}SPS")
-        logger.info(f"    timeout_detected={self.timeout_detected}")
+        result = self.result
+        logger.info(
+            f"    shot {result.shot_id}: {len(materialize(result.IN_voltage))}samples, {result.shots_captured}shots"
+        )
+        logger.info(f"    {result.sps:0.0f}SPS")
+        logger.info(f"    timeout_detected={result.timeout_detected}")
         logger.info(
-            f"    enable_start_detected={self.enable_start_detected} enable_start_s={self.enable_start_s:0.3f}s"
+            f"    enable_start_detected={result.enable_start_detected} enable_start_s={result.enable_start_s:0.3f}s"
         )
         logger.info(
-            f"    enable_end_detected={self.enable_end_detected} enable_s={self.enable_s:0.3f}s"
+            f"    enable_end_detected={result.enable_end_detected} enable_s={result.enable_s:0.3f}s"
         )
+        return result
+
+    def abort(self, exception: Exception) -> None:
+        """
+        Called if the processing thread died: Wakes up 'wait_for_acquisition()'.
+        """
+        with self.lock:
+            self._exception = exception
+            self.done_event.set()
+
+    def _raise_if_aborted(self) -> None:
+        if self._exception is not None:
+            raise Exception(
+                f"The processing of the AD samples failed: {self._exception!r}"
+            ) from self._exception
+
+    def add_gaps(self, gaps: typing.List[Gap]) -> None:
+        """
+        Called by the acquisition thread before the chunk following the gaps is appended.
+        """
+        with self.lock:
+            if self.state is State.CAPTURING:
+                self._gaps.extend(gaps)
+                return
+            # The pretrigger samples have to be contiguous
+            self._pretrigger.clear()
+        logger.warning(f"Samples lost while not capturing: {gaps}")
+
+    def append_pretrigger(self, measurements: MeasurementSequence) -> None:
+        """
+        Called for every measurement while 'ARMED'.
+        """
+        with self.lock:
+            self._pretrigger.append(measurements=measurements)
 
     def append(self, measurements: MeasurementSequence) -> None:
         with self.lock:
             if self.capturer is None:
-                idx0_start_capturing = self.idx0_start_capturing
+                # Until the timeout is detected, at most one chunk more than
+                # '_duration_max_sample' is captured: The arrays will not grow.
+                shot_directory = None
+                if self.capture_directory is not None:
+                    shot_directory, removed = create_shot_directory(
+                        self.capture_directory, keep_shots=self.capture_keep_shots
+                    )
+                    if len(removed) > 0:
+                        logger.info(
+                            "Removed %d old shot directories in '%s' (capture_keep_shots=%d)",
+                            len(removed),
+                            self.capture_directory,
+                            self.capture_keep_shots,
+                        )
                 self.capturer = Capturer(
-                    IN_voltage=measurements.adc_value_V[idx0_start_capturing:],
-                    IN_disable=measurements.IN_disable[idx0_start_capturing:],
-                    IN_t=measurements.IN_t[idx0_start_capturing:],
+                    capacity=self._pretrigger.size
+                    + self._duration_max_sample
+                    + 2 * len(measurements.adc_value_V),
+                    shot_directory=shot_directory,
+                )
+                idx0_start_capturing = self.idx0_start_capturing
+                if self._pretrigger.size > 0:
+                    # The pretrigger samples are contiguous with this measurement
+                    self._pretrigger.copy_to(self.capturer)
+                    self._idx0_arm = self._pretrigger.size
+                    idx0_start_capturing = 0
+                self.capturer.append(
+                    measurements=measurements, idx0_begin=idx0_start_capturing
                 )
                 logger.info(
                     f"{self.state.name} append({len(self.capturer.IN_voltage)}) idx0_start_capturing={idx0_start_capturing} of {len(measurements.adc_value_V)}"
@@ -214,60 +784,139 @@ class Acquistion:
                 return
 
             self.capturer.append(measurements=measurements)
-            logger.info(f"{self.state.name} append({len(measurements.adc_value_V)})")
+            self.capturer.save_progress(info=self._shot_info)
+            self._append_summary.add(samples=len(measurements.adc_value_V))
 
     def found_raising_edge(self) -> bool:
+        """
+        Only the samples appended since the last call are scanned.
+        Returns True if the timeout was detected.
+        """
+        while self._found_segment_end():
+            timeout_detected = self.timeout_detected
+            if self._segments is not None:
+                self._segments.append(acquisition=self)
+                if not self._segments.full:
+                    # Rearm: The samples after this segment may already contain the next segment
+                    self.capturer.restart(idx0_all=self._idx0_next_segment)
+                    self._reset_segment()
+                    continue
+
+            self._finish()
+            with self.lock:
+                self._done()
+            return timeout_detected
+
+        return False
+
+    def _found_segment_end(self) -> bool:
+        """
+        Returns True if the segment ended by a raising edge or a timeout.
+        """
         if TODO_REMOVE:
             logger.info(self.capturer.IN_disable)
+        IN_disable_all = self.capturer.IN_disable_all
         if not self.enable_start_detected:
             # No 'falling edge' (enable_start_detected) yet
-            idx0 = self.capturer.find_first0(self.capturer.IN_disable)
+            # Edges after the timeout are ignored: The result does not depend on the chunk size.
+            idx0_timeout_all = self._idx0_arm + self._duration_max_sample
+            idx0 = self._edge_detector.find_first(
+                IN_disable_all, value_to_find=0, end=idx0_timeout_all + 1
+            )
             if idx0 is not None:
                 # We found a falling edge
-                self.capturer.limit_begin(idx0=idx0 - (1 if ADD_PRE_POST_SAMPLE else 0))
-                # Change the value temporarely to allow triggering of the raising edge
-                self._IN_disable_first_measurement = self.capturer.IN_disable[0]
-                self.capturer.IN_disable[0] = False
+                self.capturer.limit_begin(
+                    idx0=max(0, idx0 - (1 if ADD_PRE_POST_SAMPLE else 0))
+                )
                 self.enable_start_detected = True
-                self.enable_start_s = idx0 / self._sps
+                self._idx0_window = idx0
+                # Negative if the falling edge is in the pretrigger samples
+                self.enable_start_s = (idx0 - self._idx0_arm) / self._sps
                 logger.info(
                     f"enable_start_detected: idx0={idx0} self._sps={self._sps} self.enable_start_s={self.enable_start_s:0.3f}s"
                 )
-                return False
-        else:
+
+        if self.enable_start_detected:
             # Falling edge (enable_start_detected), now look for raising edge (enable_end_detected)
-            idx0 = self.capturer.find_first1(self.capturer.IN_disable)
-            if idx0 is not None:
+            # The cursor of the edge detector is on the falling edge: The sample before is not scanned again.
+            idx0_timeout_all = self.capturer.begin + self._duration_max_sample
+            idx0_all = self._edge_detector.find_first(
+                IN_disable_all, value_to_find=1, end=idx0_timeout_all + 1
+            )
+            if idx0_all is not None:
                 # We found a raising edge
-                self.capturer.IN_disable[0] = self._IN_disable_first_measurement
+                idx0 = idx0_all - self.capturer.begin
                 self.capturer.limit_end(idx0=idx0 + (1 if ADD_PRE_POST_SAMPLE else 0))
                 self.enable_end_detected = True
                 self.enable_s = idx0 / self._sps
+                self._idx0_next_segment = idx0_all
+                self._feed_window(end=idx0_all)
                 logger.info(
                     f"enable_end_detected: idx0={idx0} self._sps={self._sps} self.enable_s={self.enable_s:0.3f}s"
                 )
-                with self.lock:
-                    self.state = State.ARMED
-                    self._done()
-                return False
+                return True
 
-        self.timeout_detected = (
-            len(self.capturer.IN_disable) > self._duration_max_sample
-        )
+            # The enable window continues: Feed the samples up to the timeout
+            self._feed_window(end=min(self.capturer.size_all, idx0_timeout_all))
+
+        idx0_timeout = self._duration_max_sample
+        if not self.enable_start_detected:
+            # The timeout starts at the arm point and not at the first pretrigger sample
+            idx0_timeout += self._idx0_arm
+        self.timeout_detected = self.capturer.samples > idx0_timeout
         if self.timeout_detected:
-            self.capturer.IN_disable[0] = self._IN_disable_first_measurement
-            self.capturer.limit_end(self._duration_max_sample)
+            self.capturer.limit_end(idx0_timeout)
             self.enable_s = self._duration_max_sample / self._sps
+            self._idx0_next_segment = self.capturer.begin + idx0_timeout
             logger.info(
-                f"TIMEOUT {len(self.capturer.IN_disable)}({self._duration_max_sample})samples {self.duration_max_s:0.3f}s {self._sps}SPS"
+                f"TIMEOUT {self.capturer.samples}({self._duration_max_sample})samples {self.duration_max_s:0.3f}s {self._sps}SPS"
             )
-            with self.lock:
-                self.state = State.ARMED
-                self._done()
             return True
 
         return False
 
+    def _feed_window(self, end: int) -> None:
+        """
+        Feeds the samples of the enable window up to 'end' (index in 'IN_disable_all').
+        """
+        begin = self._idx0_window
+        if (begin is None) or (end <= begin):
+            return
+        IN_voltage = self.capturer.IN_voltage_all(begin, end)
+        if self._psd is not None:
+            # Always the complete window: The samples have to be contiguous
+            self._psd.feed(IN_voltage)
+        if self.statistics_window is StatisticsWindow.ENABLE_AND_IN_T:
+            IN_voltage = IN_voltage[self.capturer.IN_t_all.view(begin, end)]
+        self._statistics.feed(IN_voltage)
+        self._idx0_window = end
+
+
+def _decimate_lazy(data: LazyArray, factor: int, mode: DecimationMode) -> np.ndarray:
+    return decimate(materialize(data), factor=factor, mode=mode)
+
+
+def _threshold_crossings_lazy(
+    data: LazyArray,
+    threshold_V: float,
+    dt_s: float,
+    direction: Direction,
+    interpolation: Interpolation,
+) -> np.ndarray:
+    return threshold_crossings(
+        materialize(data),
+        threshold_V=threshold_V,
+        dt_s=dt_s,
+        direction=direction,
+        interpolation=interpolation,
+    )
+
+
+def _digital_edges_lazy(
+    data: LazyArray, dt_s: float, direction: Direction
+) -> np.ndarray:
+    return digital_edges(materialize(data), dt_s=dt_s, direction=direction)
+
 
 class AdThread(threading.Thread):
     """
@@ -282,16 +931,54 @@ class AdThread(threading.Thread):
        The two threads agree, that before accessing data, the 'LOCK' has to be aquired.
        This is implement using @synchronized.
        Convention: The Labber GUI ONLY accesses methods with '_synq' in its name.
+
+     - Waiting for a shot
+       'wait_measurements()' does NOT hold the 'LOCK' while waiting:
+       The getters return the last published 'ShotResult' immediately.
     """
 
-    def __init__(self):
+    def __init__(self, ad: typing.Optional[AdLowNoiseFloat2023] = None):
+        """
+        ad: Defaults to the pico. See 'ad_source' for sources without hardware.
+        """
         self.dict_values_labber_thread_copy = {}
         super().__init__(daemon=True)
-        self.ad = AdLowNoiseFloat2023()
+        self.ad = AdLowNoiseFloat2023() if ad is None else ad
         self.register_filter1: RegisterFilter1 = RegisterFilter1.SPS_97656
         self.ad_needs_reconnect: bool = False
+        self._reconnect_requested_s: typing.Optional[float] = None
+        "time.monotonic() when the SPS was changed: Start of the reconnect."
+        self._gain_from_jumpers: typing.Optional[float] = None
+        "Read once after connect: 'Input range' does not have to access the pico."
+        self.connected_event = threading.Event()
+        "Set after the first 'ad.connect()'"
+        self.configured_event = threading.Event()
+        "Set after the configuration (pcb_status) was read. Also set if the connect failed."
+        self._startup_exception: typing.Optional[Exception] = None
+        self.decimation: int = 1
+        self.decimation_mode = DecimationMode.MEAN
+        self.sample_loss_policy = SampleLossPolicy.IGNORE
+        self.shot_id: int = 0
+        "The shot the channels 'CHANNEL_xx' belong to. Set by 'wait_measurements()'."
+        self.timing_threshold_V: float = 0.35
+        self.timing_direction = Direction.BOTH
+        self.timing_interpolation = Interpolation.LINEAR
+        self._continuity = ContinuityChecker(sps=self.register_filter1.SPS)
+        "Only accessed by the processing thread."
         self._aquisition = Acquistion()
         self._stopping = False
+        self.queue = ChunkQueue()
+        "From this thread (reading the pico) to the processing thread."
+        self._processing_thread = threading.Thread(
+            target=self._process_chunks, name="AdProcessing", daemon=True
+        )
+        self.metrics = Metrics(
+            lock=LOCK,
+            describe_errors=lambda errors: self.ad.pcb_status.list_errors(
+                error_code=errors, inclusive_status=False
+            ),
+            queue=self.queue,
+        )
 
     def run(self):
         """
@@ -311,6 +998,8 @@ class AdThread(threading.Thread):
         >>> len(y[0])
         0
         """
+        self._processing_thread.start()
+        self.metrics.start()
         while True:
             pcb_params = PcbParams(
                 scale_factor=1.0,
@@ -327,69 +1016,209 @@ class AdThread(threading.Thread):
                 logger.info(
                     f"TODO REMOVE self.ad.decoder.size()={self.ad.decoder.size()} Bytes"
                 )
-            logger.info("connect(): Start reconnect to update SPS.")
-            self.ad.connect(pcb_params=pcb_params)
-            logger.info("connect(): Done reconnect to update SPS.")
-            self._aquisition.set_SPS(pcb_params.register_filter1)
+            timer = PhaseTimer(begin_s=self._reconnect_requested_s)
+            if self._reconnect_requested_s is not None:
+                timer.phase("stop")
+            self._reconnect_requested_s = None
+            try:
+                self._connect(pcb_params=pcb_params, timer=timer)
+            except Exception as e:
+                # Report to 'wait_startup()'
+                self._startup_exception = e
+                self.configured_event.set()
+                raise
+            # The chunks before were acquired with the old SPS: Processed in order
+            self.queue.put(pcb_params.register_filter1, samples=0, force=True)
 
+            first_measurement = True
             for measurements in self.ad.iter_measurements_V(
                 pcb_params=pcb_params, do_connect=False
             ):
                 if self._stopping:
                     return
+                if first_measurement:
+                    first_measurement = False
+                    timer.phase("first_measurement")
+                    logger.info(
+                        f"connect(): {pcb_params.register_filter1.name} {timer}"
+                    )
                 if self.ad_needs_reconnect:
-                    break
+                    self.ad_needs_reconnect = False
+                    if self.register_filter1 != pcb_params.register_filter1:
+                        break
+                    # The SPS was changed and changed back again
+                    logger.info(
+                        f"SPS {self.register_filter1.name} unchanged: No reconnect required."
+                    )
+                    self._reconnect_requested_s = None
 
-                def handle_state(measurements: MeasurementSequence) -> None:
+                self.queue.put(
+                    (measurements, self.ad.decoder.size()),
+                    samples=len(measurements.adc_value_V),
+                )
 
-                    if self._aquisition.state is State.CAPTURING:
-                        if TODO_REMOVE:
+    def _process_chunks(self) -> None:
+        """
+        The processing thread: Takes the chunks from 'queue' in the order they were read.
+        """
+        try:
+            while not self._stopping:
+                entry = self.queue.get(timeout_s=0.5)
+                if entry is None:
+                    continue
+                if entry.dropped_before > 0:
+                    self._continuity.dropped(samples=entry.dropped_before)
+                if isinstance(entry.chunk, RegisterFilter1):
+                    # Reconnected. The gaps belong to the stream before the reconnect.
+                    self._take_gaps()
+                    self._aquisition.set_SPS(entry.chunk)
+                    self._continuity = ContinuityChecker(sps=entry.chunk.SPS)
+                    continue
+                measurements, decoder_backlog_bytes = entry.chunk
+                self._process_chunk(
+                    measurements=measurements,
+                    decoder_backlog_bytes=decoder_backlog_bytes,
+                    arrival_s=entry.arrival_s,
+                )
+        except Exception as e:
+            # The reader must not block on a queue nobody empties
+            self.queue.close()
+            # Labber must not wait for a shot which will never complete
+            self._aquisition.abort(e)
+            raise
+
+    def _process_chunk(
+        self,
+        measurements: MeasurementSequence,
+        decoder_backlog_bytes: int,
+        arrival_s: float,
+    ) -> None:
+        def handle_state(measurements: MeasurementSequence) -> None:
+            if self._aquisition.state is State.ARMED:
+                self._aquisition.append_pretrigger(measurements=measurements)
+                return
 
-                            logger.info(
-                                f"TODO REMOVE self.ad.decoder.size()={self.ad.decoder.size()} Bytes"
-                            )
+            if self._aquisition.state is State.CAPTURING:
+                if (self._aquisition.capturer is None) and (
+                    arrival_s < self._aquisition.time_armed_start_s
+                ):
+                    # Queued before the arm point
+                    self._aquisition.append_pretrigger(measurements=measurements)
+                    return
 
-                        self._aquisition.append(measurements=measurements)
-                        if self._aquisition.found_raising_edge():
-                            return
+                if TODO_REMOVE:
 
-                handle_state(measurements)
-                # logger.info(f"TODO REMOVE handle_state({self._aquisition.state.name})")
+                    logger.info(
+                        f"TODO REMOVE self.ad.decoder.size()={self.ad.decoder.size()} Bytes"
+                    )
 
-                def log_IN_disable_t(measurements: MeasurementSequence) -> None:
-                    msg = f"adc_value_V={measurements.adc_value_V[0]:5.2f}->{measurements.adc_value_V[-1]:5.2f}"
-                    msg += f" IN_disable={measurements.IN_disable[0]:d}->{measurements.IN_disable[-1]:d}"
-                    msg += f" IN_t={measurements.IN_t[0]:d}->{measurements.IN_t[-1]:d}"
-                    msg += f" state={self._aquisition.state.name}"
-                    msg += f" decoder.size()={self.ad.decoder.size()//3:5d} Samples"
-                    if self._aquisition.state is State.CAPTURING:
-                        msg += f" samples={len(self._aquisition.capturer.IN_voltage)}"
-                    logger.info(msg)
+                self._aquisition.append(measurements=measurements)
+                if self._aquisition.found_raising_edge():
+                    return
 
-                if False:
-                    log_IN_disable_t(measurements)
+        self._check_continuity(
+            measurements=measurements,
+            decoder_backlog_bytes=decoder_backlog_bytes,
+            now_s=arrival_s,
+        )
+        begin_s = time.perf_counter()
+        handle_state(measurements)
+        self.metrics.chunk(
+            samples=len(measurements.adc_value_V),
+            duration_s=time.perf_counter() - begin_s,
+            decoder_backlog_bytes=decoder_backlog_bytes,
+            errors=measurements.errors,
+        )
+        # logger.info(f"TODO REMOVE handle_state({self._aquisition.state.name})")
+
+        def log_IN_disable_t(measurements: MeasurementSequence) -> None:
+            msg = f"adc_value_V={measurements.adc_value_V[0]:5.2f}->{measurements.adc_value_V[-1]:5.2f}"
+            msg += f" IN_disable={measurements.IN_disable[0]:d}->{measurements.IN_disable[-1]:d}"
+            msg += f" IN_t={measurements.IN_t[0]:d}->{measurements.IN_t[-1]:d}"
+            msg += f" state={self._aquisition.state.name}"
+            msg += f" decoder.size()={self.ad.decoder.size()//3:5d} Samples"
+            if self._aquisition.state is State.CAPTURING:
+                msg += f" samples={len(self._aquisition.capturer.IN_voltage)}"
+            logger.info(msg)
+
+        if False:
+            log_IN_disable_t(measurements)
+
+        def log_errors(measurements: MeasurementSequence):
+            error_codes = self.ad.pcb_status.list_errors(
+                error_code=measurements.errors, inclusive_status=True
+            )
+            elements = []
+            elements.append(f"{measurements.adc_value_V[-1]:0.2f}V")
+            elements.append(f"{len(measurements.adc_value_V)}")
+            if measurements.IN_disable is not None:
+                elements.append(f"IN_disable={measurements.IN_disable[-1]}")
+            if measurements.IN_t is not None:
+                elements.append(f"IN_t={measurements.IN_t[-1]}")
+            elements.append(f"{int(measurements.errors):016b}")
+            elements.append(f"{error_codes}")
+            print(" ".join(elements))
+
+        if False:
+            log_errors(measurements)
+
+    def _check_continuity(
+        self,
+        measurements: MeasurementSequence,
+        decoder_backlog_bytes: int,
+        now_s: float,
+    ) -> None:
+        errors: typing.List[str] = []
+        if measurements.errors:
+            errors = self.ad.pcb_status.list_errors(
+                error_code=measurements.errors, inclusive_status=False
+            )
+        self._continuity.chunk(
+            samples=len(measurements.adc_value_V),
+            now_s=now_s,
+            # 3 bytes per sample
+            backlog_samples=decoder_backlog_bytes // 3,
+            errors=errors,
+        )
+        self._take_gaps()
 
-                def log_errors(measurements: MeasurementSequence):
-                    error_codes = self.ad.pcb_status.list_errors(
-                        error_code=measurements.errors, inclusive_status=True
-                    )
-                    elements = []
-                    elements.append(f"{measurements.adc_value_V[-1]:0.2f}V")
-                    elements.append(f"{len(measurements.adc_value_V)}")
-                    if measurements.IN_disable is not None:
-                        elements.append(f"IN_disable={measurements.IN_disable[-1]}")
-                    if measurements.IN_t is not None:
-                        elements.append(f"IN_t={measurements.IN_t[-1]}")
-                    elements.append(f"{int(measurements.errors):016b}")
-                    elements.append(f"{error_codes}")
-                    print(" ".join(elements))
-
-                if False:
-                    log_errors(measurements)
+    def _take_gaps(self) -> None:
+        if len(self._continuity.gaps) > 0:
+            self._aquisition.add_gaps(self._continuity.gaps)
+            self._continuity.gaps = []
+
+    def _connect(self, pcb_params: PcbParams, timer: PhaseTimer) -> None:
+        """
+        Changes the SPS over the open link if the AD supports 'reconfigure()'.
+        Else a full reconnect is required: This is the case for the hardware,
+        see 'Changing the sample rate' in 'doc/design.md'.
+        """
+        reconfigure = getattr(self.ad, "reconfigure", None)
+        # 'connected' is only required if 'reconfigure()' is provided
+        if (reconfigure is not None) and self.ad.connected:
+            reconfigure(pcb_params=pcb_params)
+            timer.phase("reconfigure")
+        else:
+            if self.connected_event.is_set():
+                logger.info(
+                    "%s does not support reconfigure(): Full reconnect to change the SPS",
+                    type(self.ad).__name__,
+                )
+            # Includes the USB enumeration and the handshake with the pico
+            self.ad.connect(pcb_params=pcb_params)
+            timer.phase("connect")
+        self.connected_event.set()
+        self._gain_from_jumpers = self.ad.pcb_status.gain_from_jumpers
+        timer.phase("pcb_status")
+        self.configured_event.set()
 
     def stop(self):
         self._stopping = True
+        self.queue.close()
         self.join(timeout=10.0)
+        if self._processing_thread.is_alive():
+            self._processing_thread.join(timeout=10.0)
+        self.metrics.stop()
         self.ad.close()
 
     @synchronized
@@ -401,38 +1230,112 @@ class AdThread(threading.Thread):
         # Create a copy of all values to allow access for the labber thread without any delay.
         # self.dict_values_labber_thread_copy = self._visa_station.dict_values.copy()
 
-    @synchronized
-    def wait_startup(self) -> None:
+    def wait_startup(self, timeout_s: float = STARTUP_TIMEOUT_S) -> None:
         """
-        Wait for pico to connect and read all configuration
+        Wait for pico to connect and read all configuration.
+        Not synchronized: Labber may set quantities while the pico connects.
         """
-        if TODO_REMOVE:
-            logger.info("TODO REMOVE wait_startup() ENTER")
-        next_msg_s = time.monotonic() + 20.0
-        while not self.ad.connected:
-            if next_msg_s > time.monotonic():
-                logger.info("Waiting to be connected...")
-                next_msg_s += 10.0
-            time.sleep(0.5)
-        if TODO_REMOVE:
-            logger.info("TODO REMOVE wait_startup() LEAVE")
+        begin_s = time.monotonic()
+        while not self.configured_event.wait(timeout=STARTUP_MESSAGE_S):
+            duration_s = time.monotonic() - begin_s
+            if self.connected_event.is_set():
+                logger.info(f"Connected, reading configuration... {duration_s:0.0f}s")
+            else:
+                logger.info(f"Waiting to be connected... {duration_s:0.0f}s")
+            if duration_s > timeout_s:
+                raise Exception(
+                    f"The AD pico did not connect within {timeout_s:0.0f}s."
+                )
+        if self._startup_exception is not None:
+            raise Exception(
+                f"Failed to connect to the AD pico: {self._startup_exception}"
+            ) from self._startup_exception
+        duration_s = time.monotonic() - begin_s
+        if duration_s > 0.01:
+            logger.info(f"wait_startup(): waited {duration_s:0.3f}s")
+
+    def _wait_shot(self) -> ShotResult:
+        """
+        Applies 'sample_loss_policy'.
+        """
+        for retry in range(SAMPLE_LOSS_RETRIES + 1):
+            # The arm point is the first chunk which arrived after arming:
+            # See 'arrival_s' in '_process_chunk()'. No samples are skipped.
+            result = self._aquisition.wait_for_acquisition(idx0_start_capturing=0)
+            if len(result.gaps) == 0:
+                return result
+            if self.sample_loss_policy is SampleLossPolicy.IGNORE:
+                logger.warning(
+                    "shot %d: %d samples lost: %s",
+                    result.shot_id,
+                    result.samples_lost,
+                    result.gaps,
+                )
+                return result
+            msg = f"shot {result.shot_id}: {result.samples_lost} samples lost: {result.gaps}"
+            if self.sample_loss_policy is SampleLossPolicy.FAIL:
+                raise Exception(msg)
+            if retry < SAMPLE_LOSS_RETRIES:
+                logger.warning(
+                    "shot %d: %d samples lost: %s: Retry %d/%d",
+                    result.shot_id,
+                    result.samples_lost,
+                    result.gaps,
+                    retry + 1,
+                    SAMPLE_LOSS_RETRIES,
+                )
+        raise Exception(f"{msg}: Giving up after {SAMPLE_LOSS_RETRIES} retries.")
 
-    @synchronized
     def wait_measurements(self) -> None:
         """
         This method will until the measurements are acquired.
+        Called by the labber thread. Not synchronized: The getters must not be blocked during the capture.
         """
         if TODO_REMOVE:
             logger.info("TODO REMOVE wait_measurements() ENTER")
-        self._aquisition.wait_for_acquisition(
-            idx0_start_capturing=self.ad.decoder.size()
-        )
+        result = self._wait_shot()
         if TODO_REMOVE:
             logger.info("TODO REMOVE wait_measurements() LEAVE")
 
-        CHANNEL_DISABLE.data = self._aquisition.capturer.IN_disable
-        CHANNEL_T.data = self._aquisition.capturer.IN_t
-        CHANNEL_VOLTAGE.data = self._aquisition.capturer.IN_voltage
+        with LOCK:
+            decimation = self.decimation
+            decimation_mode = self.decimation_mode
+            timing_threshold_V = self.timing_threshold_V
+            timing_direction = self.timing_direction
+            timing_interpolation = self.timing_interpolation
+        dt_s = decimated_dt_s(sps=result.sps, factor=decimation, mode=decimation_mode)
+        for channel, data in (
+            (CHANNEL_DISABLE, result.IN_disable),
+            (CHANNEL_T, result.IN_t),
+            (CHANNEL_VOLTAGE, result.IN_voltage),
+        ):
+            # Expanded and decimated only when Labber reads the channel
+            channel.data = functools.partial(
+                _decimate_lazy,
+                data,
+                factor=decimation,
+                mode=decimation_mode,
+            )
+            channel.dt_s = dt_s
+
+        # Sub-sample timing: Always at the full sample rate, calculated only when Labber reads the channel
+        CHANNEL_VOLTAGE_CROSSINGS.data = functools.partial(
+            _threshold_crossings_lazy,
+            result.IN_voltage,
+            threshold_V=timing_threshold_V,
+            dt_s=1.0 / result.sps,
+            direction=timing_direction,
+            interpolation=timing_interpolation,
+        )
+        CHANNEL_T_EDGES.data = functools.partial(
+            _digital_edges_lazy,
+            result.IN_t,
+            dt_s=1.0 / result.sps,
+            direction=timing_direction,
+        )
+        CHANNEL_PSD.data = result.psd_V2_Hz
+        CHANNEL_PSD.dt_s = result.psd_df_Hz
+        self.shot_id = result.shot_id
 
     @synchronized
     def set_quantity_sync(self, quant_name: str, value):
@@ -448,6 +1351,8 @@ class AdThread(threading.Thread):
                 logger.info(
                     f"SPS changed from {before.name} to {self.register_filter1.name}: Requires reconnect to the AD pico."
                 )
+                if self._reconnect_requested_s is None:
+                    self._reconnect_requested_s = time.monotonic()
                 self.ad_needs_reconnect = True
             return value
 
@@ -457,12 +1362,117 @@ class AdThread(threading.Thread):
             self._aquisition.duration_max_s = value
             return value
 
+        if quant_name == "pretrigger_s":
+            value = max(0.0, value)
+            value = min(10.0, value)
+            self._aquisition.pretrigger_s = value
+            return value
+
+        if quant_name == "shots_per_read":
+            value = max(1, round(value))
+            value = min(100_000, value)
+            self._aquisition.shots_per_read = value
+            return value
+
+        if quant_name == "shots_mode":
+            self._aquisition.shots_mode = ShotsMode.get_exception(value)
+            return value
+
+        if quant_name == "capture_directory":
+            self._aquisition.capture_directory = pathlib.Path(value) if value else None
+            return value
+
+        if quant_name == "capture_keep_shots":
+            value = max(0, round(value))
+            self._aquisition.capture_keep_shots = value
+            return value
+
+        if quant_name == "decimation":
+            value = max(1, round(value))
+            self.decimation = value
+            return value
+
+        if quant_name == "decimation_mode":
+            self.decimation_mode = DecimationMode.get_exception(value)
+            return value
+
+        if quant_name == "timing_threshold_V":
+            self.timing_threshold_V = value
+            return value
+
+        if quant_name == "timing_direction":
+            self.timing_direction = Direction.get_exception(value)
+            return value
+
+        if quant_name == "timing_interpolation":
+            self.timing_interpolation = Interpolation.get_exception(value)
+            return value
+
+        if quant_name == "sample_loss_policy":
+            self.sample_loss_policy = SampleLossPolicy.get_exception(value)
+            return value
+
+        if quant_name == "chunk_queue_size":
+            value = max(1, int(value))
+            self.queue.maxsize = value
+            return value
+
+        if quant_name == "chunk_queue_back_pressure":
+            self.queue.back_pressure = BackPressure.get_exception(value)
+            return value
+
+        if quant_name == "statistics_window":
+            self._aquisition.statistics_window = StatisticsWindow.get_exception(value)
+            return value
+
+        if quant_name == "psd_segment_samples":
+            value = max(0, round(value))
+            value = min(1 << 24, value)
+            self._aquisition.psd_segment_samples = value
+            return value
+
+        if quant_name == "psd_window":
+            self._aquisition.psd_window = PsdWindow.get_exception(value)
+            return value
+
+        if quant_name == "psd_overlap":
+            value = max(0.0, value)
+            value = min(0.95, value)
+            self._aquisition.psd_overlap = value
+            return value
+
+        if quant_name == "psd_average":
+            self._aquisition.psd_average = PsdAverage.get_exception(value)
+            return value
+
+        if quant_name == "metrics_interval_s":
+            value = max(0.1, value)
+            self.metrics.interval_s = value
+            return value
+
+        if quant_name == "metrics_file":
+            self.metrics.filename = pathlib.Path(value) if value else None
+            return value
+
         return None
 
-    @synchronized
     def get_quantity_sync(self, quant):
+        """
+        Not synchronized: 'Input range' waits for the connect without holding 'LOCK'.
+        """
+        if quant.name == "Input range" and self._gain_from_jumpers is None:
+            # Not connected yet
+            self.configured_event.wait(timeout=STARTUP_TIMEOUT_S)
+        return self._get_quantity_sync(quant)
+
+    @synchronized
+    def _get_quantity_sync(self, quant):
         if quant.name == "Input range":
-            return AD_FS_V / self.ad.pcb_status.gain_from_jumpers
+            gain_from_jumpers = self._gain_from_jumpers
+            if gain_from_jumpers is None:
+                # The connect failed
+                gain_from_jumpers = self.ad.pcb_status.gain_from_jumpers
+            return AD_FS_V / gain_from_jumpers
 
         if quant.name == "sample_rate_SPS":
             return self.register_filter1.name
@@ -470,20 +1480,104 @@ class AdThread(threading.Thread):
         if quant.name == "duration_max_s":
             return self._aquisition.duration_max_s
 
+        if quant.name == "pretrigger_s":
+            return self._aquisition.pretrigger_s
+
+        if quant.name == "shots_per_read":
+            return self._aquisition.shots_per_read
+
+        if quant.name == "shots_mode":
+            return self._aquisition.shots_mode.name
+
+        if quant.name == "shots_captured":
+            return self._aquisition.result.shots_captured
+
+        if quant.name == "decimation":
+            return self.decimation
+
+        if quant.name == "capture_directory":
+            capture_directory = self._aquisition.capture_directory
+            return "" if capture_directory is None else str(capture_directory)
+
+        if quant.name == "capture_keep_shots":
+            return self._aquisition.capture_keep_shots
+
+        if quant.name == "decimation_mode":
+            return self.decimation_mode.name
+
+        if quant.name == "timing_threshold_V":
+            return self.timing_threshold_V
+
+        if quant.name == "timing_direction":
+            return self.timing_direction.name
+
+        if quant.name == "timing_interpolation":
+            return self.timing_interpolation.name
+
+        if quant.name == "sample_loss_policy":
+            return self.sample_loss_policy.name
+
+        if quant.name == "chunk_queue_size":
+            return self.queue.maxsize
+
+        if quant.name == "chunk_queue_back_pressure":
+            return self.queue.back_pressure.name
+
+        if quant.name == "samples_lost":
+            return self._aquisition.result.samples_lost
+
+        if quant.name == "gaps_detected":
+            return len(self._aquisition.result.gaps)
+
+        if quant.name == "statistics_window":
+            return self._aquisition.statistics_window.name
+
+        if quant.name.startswith(STATISTICS_PREFIX):
+            return getattr(
+                self._aquisition.result.statistics,
+                quant.name[len(STATISTICS_PREFIX) :],
+            )
+
+        if quant.name == "psd_segment_samples":
+            return self._aquisition.psd_segment_samples
+
+        if quant.name == "psd_window":
+            return self._aquisition.psd_window.name
+
+        if quant.name == "psd_overlap":
+            return self._aquisition.psd_overlap
+
+        if quant.name == "psd_average":
+            return self._aquisition.psd_average.name
+
+        if quant.name == "metrics_interval_s":
+            return self.metrics.interval_s
+
+        if quant.name == "metrics_file":
+            filename = self.metrics.filename
+            return "" if filename is None else str(filename)
+
+        if quant.name.startswith(METRICS_PREFIX):
+            value = self.metrics.snapshot.get(quant.name[len(METRICS_PREFIX) :], None)
+            if value is not None:
+                return value
+            # No interval completed yet
+            return 0.0
+
         if quant.name == "timeout_detected":
-            return self._aquisition.timeout_detected
+            return self._aquisition.result.timeout_detected
 
         if quant.name == "enable_start_detected":
-            return self._aquisition.enable_start_detected
+            return self._aquisition.result.enable_start_detected
 
         if quant.name == "enable_end_detected":
-            return self._aquisition.enable_end_detected
+            return self._aquisition.result.enable_end_detected
 
         if quant.name == "enable_start_s":
-            return self._aquisition.enable_start_s
+            return self._aquisition.result.enable_start_s
 
         if quant.name == "enable_s":
-            return self._aquisition.enable_s
+            return self._aquisition.result.enable_s
 
         return None
 
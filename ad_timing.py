@@ -0,0 +1,152 @@
+"""
+Sub-sample timing of edges: Evaluated after the capture on the traces of a shot.
+
+The edges found while capturing ('enable_start_s', 'enable_s') have a resolution of one sample.
+Here, the crossings of 'IN_voltage' through a threshold are interpolated between the samples
+and the edges of 'IN_t' are placed between the two samples (half a sample).
+All crossings of a shot are calculated vectorized, block by block.
+"""
+
+from __future__ import annotations
+import enum
+
+import numpy as np
+
+from logging_utils import EnumMixin
+
+BLOCK_SAMPLES = 1 << 16
+"""
+The trace is processed block by block: The temporary arrays are bounded by this size.
+"""
+
+NEWTON_ITERATIONS = 4
+
+
+class Interpolation(EnumMixin, enum.Enum):
+    LINEAR = "LINEAR"
+    CUBIC = "CUBIC"
+    "Catmull-Rom spline through the two samples before and after the crossing"
+
+
+class Direction(EnumMixin, enum.Enum):
+    RISING = "RISING"
+    FALLING = "FALLING"
+    BOTH = "BOTH"
+
+
+def _select(below: np.ndarray, direction: Direction) -> np.ndarray:
+    """
+    Returns the indices i where the crossing is between sample i and i+1.
+    below: True where the sample is below the threshold.
+    """
+    if direction is Direction.RISING:
+        crossing = below[:-1] & ~below[1:]
+    elif direction is Direction.FALLING:
+        crossing = ~below[:-1] & below[1:]
+    else:
+        crossing = below[:-1] != below[1:]
+    return np.flatnonzero(crossing)
+
+
+def _catmull_rom(
+    p0: np.ndarray, p1: np.ndarray, p2: np.ndarray, p3: np.ndarray, u: np.ndarray
+) -> np.ndarray:
+    return 0.5 * (
+        2.0 * p1
+        + (p2 - p0) * u
+        + (2.0 * p0 - 5.0 * p1 + 4.0 * p2 - p3) * u**2
+        + (3.0 * p1 - p0 - 3.0 * p2 + p3) * u**3
+    )
+
+
+def _catmull_rom_derivative(
+    p0: np.ndarray, p1: np.ndarray, p2: np.ndarray, p3: np.ndarray, u: np.ndarray
+) -> np.ndarray:
+    return 0.5 * (
+        (p2 - p0)
+        + 2.0 * (2.0 * p0 - 5.0 * p1 + 4.0 * p2 - p3) * u
+        + 3.0 * (3.0 * p1 - p0 - 3.0 * p2 + p3) * u**2
+    )
+
+
+def _fraction(
+    voltage: np.ndarray,
+    indices: np.ndarray,
+    threshold_V: float,
+    interpolation: Interpolation,
+) -> np.ndarray:
+    """
+    Returns the position of the crossing between sample i and i+1: 0.0 <= u <= 1.0.
+    """
+    p1 = voltage[indices]
+    p2 = voltage[indices + 1]
+    u = (threshold_V - p1) / (p2 - p1)
+    if interpolation is Interpolation.LINEAR:
+        return u
+
+    last = len(voltage) - 1
+    p0 = voltage[np.maximum(indices - 1, 0)]
+    p3 = voltage[np.minimum(indices + 2, last)]
+    u_linear = u
+    for _ in range(NEWTON_ITERATIONS):
+        slope = _catmull_rom_derivative(p0, p1, p2, p3, u)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = u - (_catmull_rom(p0, p1, p2, p3, u) - threshold_V) / slope
+        u = np.clip(np.where(np.isfinite(u), u, 0.5), 0.0, 1.0)
+    # Newton did not converge (for example an inflection point): Fall back to linear
+    residual = np.abs(_catmull_rom(p0, p1, p2, p3, u) - threshold_V)
+    return np.where(residual <= 1e-6 * np.abs(p2 - p1), u, u_linear)
+
+
+def threshold_crossings(
+    voltage: np.ndarray,
+    threshold_V: float,
+    dt_s: float,
+    direction: Direction = Direction.BOTH,
+    interpolation: Interpolation = Interpolation.LINEAR,
+) -> np.ndarray:
+    """
+    Returns the times of the crossings of 'voltage' through 'threshold_V'.
+    The time of the first sample is 0.0.
+
+    >>> voltage = np.array([0.0, 0.0, 1.0, 1.0, 0.0])
+    >>> threshold_crossings(voltage, threshold_V=0.25, dt_s=1.0)
+    array([1.25, 3.75])
+    >>> threshold_crossings(voltage, threshold_V=0.25, dt_s=1.0, direction=Direction.RISING)
+    array([1.25])
+    >>> threshold_crossings(np.array([0.0, 1.0, 2.0, 3.0]), threshold_V=1.5, dt_s=0.1, interpolation=Interpolation.CUBIC)
+    array([0.15])
+    """
+    voltage = np.asarray(voltage, dtype=np.float64)
+    crossings = []
+    # The blocks overlap: The cubic interpolation needs the sample before and the sample after
+    for begin in range(0, max(len(voltage) - 1, 0), BLOCK_SAMPLES):
+        idx0 = max(begin - 1, 0)
+        block = voltage[idx0 : begin + BLOCK_SAMPLES + 2]
+        indices = _select(block < threshold_V, direction=direction)
+        # The crossing between sample i and i+1 belongs to the block containing i
+        indices = indices[
+            (indices + idx0 >= begin) & (indices + idx0 < begin + BLOCK_SAMPLES)
+        ]
+        fraction = _fraction(
+            block, indices, threshold_V=threshold_V, interpolation=interpolation
+        )
+        crossings.append((indices + idx0 + fraction) * dt_s)
+    if len(crossings) == 0:
+        return np.empty(0, dtype=np.float64)
+    return np.concatenate(crossings)
+
+
+def digital_edges(
+    digital: np.ndarray, dt_s: float, direction: Direction = Direction.BOTH
+) -> np.ndarray:
+    """
+    Returns the times of the edges of a digital trace.
+    The edge happened between the two samples: Half a sample after the last sample before the edge.
+    Values above 0.5 are high: This also works for averaged traces.
+
+    >>> digital_edges(np.array([0, 0, 1, 1, 0], dtype=bool), dt_s=1.0)
+    array([1.5, 3.5])
+    """
+    indices = _select(np.asarray(digital) <= 0.5, direction=direction)
+    return (indices + 0.5) * dt_s
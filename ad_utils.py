@@ -1,6 +1,18 @@
+import typing
 import dataclasses
 import numpy as np
 
+LazyArray = typing.Union[np.ndarray, typing.Callable[[], np.ndarray]]
+"""
+An array or a function which will return the array when called.
+"""
+
+
+def materialize(data: LazyArray) -> np.ndarray:
+    if callable(data):
+        return data()
+    return data
+
 
 class DriverAbortException(Exception):
     pass
@@ -9,17 +21,64 @@ class DriverAbortException(Exception):
 @dataclasses.dataclass()
 class Channel:
     label: str
-    data: np.array = dataclasses.field(default_factory=lambda: np.array([]))
+    _data: LazyArray = dataclasses.field(default_factory=lambda: np.array([]))
+    dt_s: float = 1.0
+    "Step of the x axis between two samples in 'data': Time, or frequency for a spectrum"
+    allow_empty: bool = False
+    "For example: No edges found"
+
+    @property
+    def data(self) -> np.ndarray:
+        """
+        The data is materialized when accessed the first time.
+        """
+        self._data = materialize(self._data)
+        return self._data
+
+    @data.setter
+    def data(self, data: LazyArray) -> None:
+        self._data = data
 
     def reset(self) -> None:
         self.data.clear()
 
 
+class TraceCache:
+    """
+    The traces of one shot as returned to Labber.
+
+    Converted to float64 (the dtype Labber stores) and wrapped by 'quant.getTraceDict()'
+    when read the first time. Further reads of the same shot return the cached trace dict.
+    A new shot id invalidates the cache.
+    """
+
+    def __init__(self):
+        self.shot_id: typing.Optional[int] = None
+        self._trace_dicts: typing.Dict[str, dict] = {}
+
+    def trace_dict(self, shot_id: int, channel: Channel, quant) -> dict:
+        if shot_id != self.shot_id:
+            self._trace_dicts.clear()
+            self.shot_id = shot_id
+        trace_dict = self._trace_dicts.get(channel.label, None)
+        if trace_dict is None:
+            data = np.ascontiguousarray(channel.data, dtype=np.float64)
+            trace_dict = quant.getTraceDict(data, dt=channel.dt_s)
+            self._trace_dicts[channel.label] = trace_dict
+        return trace_dict
+
+
 CHANNEL_T = Channel("IN_t")
 CHANNEL_DISABLE = Channel("IN_disable")
 CHANNEL_VOLTAGE = Channel("IN_voltage")
+CHANNEL_VOLTAGE_CROSSINGS = Channel("IN_voltage_crossings_s", allow_empty=True)
+CHANNEL_T_EDGES = Channel("IN_t_edges_s", allow_empty=True)
+CHANNEL_PSD = Channel("IN_voltage_psd", allow_empty=True)
 CHANNELS = [
     CHANNEL_T,
     CHANNEL_DISABLE,
     CHANNEL_VOLTAGE,
+    CHANNEL_VOLTAGE_CROSSINGS,
+    CHANNEL_T_EDGES,
+    CHANNEL_PSD,
 ]
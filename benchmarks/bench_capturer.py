@@ -0,0 +1,137 @@
+"""
+Benchmark 'ad_thread.Capturer': Time per chunk and peak memory for a shot.
+
+Synthetic chunks with the shape of a 'MeasurementSequence' are fed into the Capturer.
+Every shot runs in its own process, so 'peak RSS' is the peak of this shot only.
+
+Usage (from the root of this repo):
+
+    python -m benchmarks.bench_capturer
+    python -m benchmarks.bench_capturer --durations 1 60 --chunk-samples 2048
+    python -m benchmarks.bench_capturer --capture-directory /tmp/capture
+"""
+
+from __future__ import annotations
+import sys
+import time
+import json
+import pathlib
+import argparse
+import subprocess
+import typing
+
+import numpy as np
+
+from ad_low_noise_float_2023.constants import RegisterFilter1
+
+import ad_thread
+import ad_capture
+from ad_source import SyntheticMeasurements
+
+DURATIONS_S = (1.0, 60.0, 1000.0)
+
+
+def peak_rss_MB() -> float:
+    try:
+        import resource  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        # Windows
+        return float("nan")
+    # Linux: ru_maxrss is in kBytes
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def run_shot(
+    duration_s: float,
+    sps: float,
+    chunk_samples: int,
+    capture_directory: typing.Optional[pathlib.Path],
+) -> dict:
+    chunk = SyntheticMeasurements(
+        adc_value_V=np.random.default_rng(0).normal(size=chunk_samples),
+        IN_disable=np.zeros(chunk_samples, dtype=bool),
+        IN_t=np.zeros(chunk_samples, dtype=bool),
+    )
+    samples = int(duration_s * sps)
+    chunks = max(1, samples // chunk_samples)
+
+    rss_before_MB = peak_rss_MB()
+    shot_directory = None
+    if capture_directory is not None:
+        shot_directory, _removed = ad_capture.create_shot_directory(capture_directory)
+    capturer = ad_thread.Capturer(
+        capacity=samples + 2 * chunk_samples, shot_directory=shot_directory
+    )
+    begin_s = time.perf_counter()
+    for _ in range(chunks):
+        capturer.append(measurements=chunk)
+    duration_append_s = time.perf_counter() - begin_s
+    assert len(capturer.IN_voltage) == chunks * chunk_samples
+
+    return {
+        "duration_s": duration_s,
+        "sps": sps,
+        "chunk_samples": chunk_samples,
+        "chunks": chunks,
+        "capture_to_disk": capture_directory is not None,
+        "us_per_chunk": 1e6 * duration_append_s / chunks,
+        "peak_rss_before_MB": rss_before_MB,
+        "peak_rss_MB": peak_rss_MB(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--durations", type=float, nargs="+", default=DURATIONS_S)
+    parser.add_argument("--chunk-samples", type=int, default=1024)
+    parser.add_argument(
+        "--sample-rate",
+        default=RegisterFilter1.SPS_97656.name,
+        choices=[r.name for r in RegisterFilter1],
+    )
+    parser.add_argument(
+        "--capture-directory",
+        type=pathlib.Path,
+        default=None,
+        help="Write the samples to memory mapped files in this directory.",
+    )
+    parser.add_argument(
+        "--single-shot",
+        action="store_true",
+        help="Internal: Run the first duration in this process and print json.",
+    )
+    args = parser.parse_args()
+    sps = RegisterFilter1.factory(args.sample_rate).SPS
+
+    if args.single_shot:
+        result = run_shot(
+            duration_s=args.durations[0],
+            sps=sps,
+            chunk_samples=args.chunk_samples,
+            capture_directory=args.capture_directory,
+        )
+        print(json.dumps(result))
+        return
+
+    print(f"{args.sample_rate}, {args.chunk_samples} samples per chunk")
+    for duration_s in args.durations:
+        command = [
+            sys.executable,
+            "-m",
+            "benchmarks.bench_capturer",
+            "--single-shot",
+            f"--durations={duration_s}",
+            f"--chunk-samples={args.chunk_samples}",
+            f"--sample-rate={args.sample_rate}",
+        ]
+        if args.capture_directory is not None:
+            command.append(f"--capture-directory={args.capture_directory}")
+        output = subprocess.check_output(command, text=True)
+        result = json.loads(output.splitlines()[-1])
+        print(
+            f"  shot {duration_s:7.1f}s: {result['chunks']:8d} chunks, {result['us_per_chunk']:7.2f}us/chunk, peak RSS {result['peak_rss_MB']:8.1f}MB"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Stress test: Latency of 'get_quantity_sync()' while a shot is captured.
+
+'AdThread' runs against a realtime synthetic source without enable pulse:
+Every shot ends by the timeout after 'duration_max_s'.
+While the Labber thread waits in 'wait_measurements()', some threads call the getters
+as fast as possible and record the time of every call.
+'test_ad_thread.py' asserts that the getters do not block on the shot.
+
+Usage (from the root of this repo):
+
+    python -m benchmarks.bench_getter_latency
+    python -m benchmarks.bench_getter_latency --duration 2 --threads 8
+"""
+
+from __future__ import annotations
+import time
+import types
+import argparse
+import threading
+import typing
+
+import numpy as np
+
+import ad_thread
+from ad_source import SyntheticSignal, SyntheticSource
+
+QUANTITY_NAMES = (
+    "Input range",
+    "duration_max_s",
+    "sample_rate_SPS",
+    "timeout_detected",
+    "enable_s",
+)
+
+
+def measure(
+    duration_s: float, threads: int
+) -> typing.Tuple[ad_thread.ShotResult, float, np.ndarray]:
+    """
+    Returns the shot, the duration of 'wait_measurements()' and the latency of every getter call.
+    """
+    # The enable pulse is never reached: Timeout
+    signal = SyntheticSignal(period_s=1e6, enable_start_s=1e5)
+    thread = ad_thread.AdThread(ad=SyntheticSource(signal=signal, realtime=True))
+    thread.set_quantity_sync(quant_name="duration_max_s", value=duration_s)
+    thread.start()
+    thread.wait_startup()
+
+    stopping = threading.Event()
+    latencies_s: typing.List[typing.List[float]] = [[] for _ in range(threads)]
+
+    def getter_thread(latency_s: typing.List[float]) -> None:
+        quants = [types.SimpleNamespace(name=name) for name in QUANTITY_NAMES]
+        while not stopping.is_set():
+            for quant in quants:
+                begin_s = time.perf_counter()
+                thread.get_quantity_sync(quant)
+                latency_s.append(time.perf_counter() - begin_s)
+
+    getters = [
+        threading.Thread(target=getter_thread, args=(latency_s,), daemon=True)
+        for latency_s in latencies_s
+    ]
+    for getter in getters:
+        getter.start()
+
+    begin_s = time.perf_counter()
+    thread.wait_measurements()
+    duration_shot_s = time.perf_counter() - begin_s
+    stopping.set()
+    for getter in getters:
+        getter.join()
+    thread.stop()
+
+    latency_s = np.concatenate([np.array(latency) for latency in latencies_s])
+    return thread._aquisition.result, duration_shot_s, latency_s
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--duration", type=float, default=10.0, help="duration_max_s of the shot."
+    )
+    parser.add_argument("--threads", type=int, default=4, help="Getter threads.")
+    args = parser.parse_args()
+
+    result, duration_shot_s, latency_s = measure(
+        duration_s=args.duration, threads=args.threads
+    )
+    latency_us = latency_s * 1e6
+    print(
+        f"shot {result.shot_id}: {duration_shot_s:0.2f}s, timeout_detected={result.timeout_detected}"
+    )
+    print(
+        f"{len(latency_us)} getter calls from {args.threads} threads: "
+        + ", ".join(
+            f"p{p}={np.percentile(latency_us, p):0.1f}us" for p in (50, 99, 99.9)
+        )
+        + f", max={latency_us.max():0.1f}us"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,216 @@
+"""
+Benchmark the capture pipeline: 'Acquistion', 'Capturer' and 'found_raising_edge()'.
+
+For every sample rate of 'RegisterFilter1', synthetic chunks are fed into 'Acquistion'
+the same way as 'AdThread.run()' does, as fast as possible.
+A second thread plays the role of Labber and waits for the shots.
+
+Reported per sample rate:
+  * headroom: samples processed per second / sample rate.
+    The time waiting for the Labber thread is not included.
+  * chunk_us: percentiles of the processing time per chunk
+  * latency_ms: percentiles of the time from the chunk containing the raising edge
+    to the Labber thread returning from 'wait_for_acquisition()'
+  * handoff_ms: percentiles of the time from the end of the processing of this chunk
+    to the Labber thread returning from 'wait_for_acquisition()'
+  * peak_MB: peak of the memory allocated (tracemalloc)
+
+Usage (from the root of this repo):
+
+    python -m benchmarks.bench_pipeline --output before.json
+    python -m benchmarks.bench_pipeline --output after.json --compare before.json
+"""
+
+from __future__ import annotations
+import sys
+import time
+import json
+import pathlib
+import argparse
+import platform
+import threading
+import subprocess
+import tracemalloc
+import typing
+
+import numpy as np
+
+from ad_low_noise_float_2023.constants import RegisterFilter1
+
+import ad_thread
+from ad_source import SyntheticSignal, SyntheticSource, SyntheticMeasurements
+
+PERCENTILES = (50, 90, 99, 100)
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def percentiles(values: typing.List[float], scale: float) -> dict:
+    if len(values) == 0:
+        return {}
+    array = np.array(values) * scale
+    return {f"p{p}": float(np.percentile(array, p)) for p in PERCENTILES}
+
+
+def generate_chunks(
+    register_filter1: RegisterFilter1,
+    signal: SyntheticSignal,
+    duration_s: float,
+    chunk_samples: int,
+) -> typing.List[SyntheticMeasurements]:
+    """
+    The chunks are generated in advance: Only the pipeline is measured.
+    """
+    source = SyntheticSource(
+        signal=signal, chunk_samples=(chunk_samples, chunk_samples)
+    )
+    source.connect(
+        pcb_params=ad_thread.PcbParams(
+            scale_factor=1.0, register_filter1=register_filter1, resolution22=True
+        )
+    )
+    chunks = int(duration_s * register_filter1.SPS) // chunk_samples
+    return [
+        source._generate(idx0=i * chunk_samples, samples=chunk_samples)
+        for i in range(chunks)
+    ]
+
+
+def run_rate(
+    register_filter1: RegisterFilter1,
+    signal: SyntheticSignal,
+    duration_s: float,
+    chunk_samples: int,
+) -> dict:
+    chunks = generate_chunks(
+        register_filter1=register_filter1,
+        signal=signal,
+        duration_s=duration_s,
+        chunk_samples=chunk_samples,
+    )
+
+    acquisition = ad_thread.Acquistion()
+    acquisition.set_SPS(register_filter1)
+    acquisition.duration_max_s = 2 * signal.period_s
+
+    shots_done_s: typing.List[float] = []
+    stopping = False
+
+    def labber_thread() -> None:
+        while not stopping:
+            acquisition.wait_for_acquisition(idx0_start_capturing=0)
+            shots_done_s.append(time.perf_counter())
+
+    tracemalloc.start()
+    thread = threading.Thread(target=labber_thread, daemon=True)
+    thread.start()
+
+    chunk_s: typing.List[float] = []
+    latency_s: typing.List[float] = []
+    handoff_s: typing.List[float] = []
+    waiting_s = 0.0
+    "Time spent waiting for the Labber thread: Not processing"
+    begin_s = time.perf_counter()
+    for measurements in chunks:
+        chunk_begin_s = time.perf_counter()
+        shots_before = len(shots_done_s)
+        shot_done = False
+        if acquisition.state is ad_thread.State.CAPTURING:
+            acquisition.append(measurements=measurements)
+            acquisition.found_raising_edge()
+            shot_done = acquisition.done_event.is_set()
+        else:
+            acquisition.append_pretrigger(measurements=measurements)
+        chunk_end_s = time.perf_counter()
+        chunk_s.append(chunk_end_s - chunk_begin_s)
+        if shot_done:
+            # Wait for the Labber thread to pick up the shot
+            while len(shots_done_s) == shots_before:
+                time.sleep(0)
+            latency_s.append(shots_done_s[-1] - chunk_begin_s)
+            handoff_s.append(shots_done_s[-1] - chunk_end_s)
+            waiting_s += time.perf_counter() - chunk_end_s
+    duration_processing_s = time.perf_counter() - begin_s - waiting_s
+    stopping = True
+    _current, peak_bytes = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    samples = len(chunks) * chunk_samples
+    return {
+        "sps": register_filter1.SPS,
+        "chunks": len(chunks),
+        "shots": len(latency_s),
+        "headroom": samples / duration_processing_s / register_filter1.SPS,
+        "chunk_us": percentiles(chunk_s, scale=1e6),
+        "latency_ms": percentiles(latency_s, scale=1e3),
+        "handoff_ms": percentiles(handoff_s, scale=1e3),
+        "peak_MB": peak_bytes / 1e6,
+    }
+
+
+def print_results(results: dict, baseline: typing.Optional[dict]) -> None:
+    print(
+        f"{'rate':10s} {'headroom':>10s} {'chunk p50':>10s} {'chunk p99':>10s} {'latency p50':>12s} {'handoff p50':>12s} {'peak':>8s}"
+    )
+    for name, result in results["rates"].items():
+        line = f"{name:10s} {result['headroom']:10.1f} {result['chunk_us']['p50']:8.1f}us {result['chunk_us']['p99']:8.1f}us {result['latency_ms'].get('p50', float('nan')):10.2f}ms {result['handoff_ms'].get('p50', float('nan')):10.2f}ms {result['peak_MB']:6.1f}MB"
+        if baseline is not None and name in baseline["rates"]:
+            before = baseline["rates"][name]
+            line += f"  headroom {result['headroom']/before['headroom']:5.2f}x, chunk p50 {result['chunk_us']['p50']/before['chunk_us']['p50']:5.2f}x vs {baseline['commit']}"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--duration",
+        type=float,
+        default=10.0,
+        help="Seconds of samples per sample rate.",
+    )
+    parser.add_argument("--chunk-samples", type=int, default=1000)
+    parser.add_argument("--output", type=pathlib.Path, default=None)
+    parser.add_argument(
+        "--compare", type=pathlib.Path, default=None, help="Results of an earlier run."
+    )
+    args = parser.parse_args()
+
+    signal = SyntheticSignal(period_s=0.5, enable_start_s=0.1, enable_s=0.2)
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "duration_s": args.duration,
+        "chunk_samples": args.chunk_samples,
+        "rates": {},
+    }
+    for register_filter1 in sorted(RegisterFilter1, key=lambda r: r.SPS):
+        results["rates"][register_filter1.name] = run_rate(
+            register_filter1=register_filter1,
+            signal=signal,
+            duration_s=args.duration,
+            chunk_samples=args.chunk_samples,
+        )
+
+    baseline = None
+    if args.compare is not None:
+        baseline = json.loads(args.compare.read_text())
+    print_results(results=results, baseline=baseline)
+
+    if args.output is not None:
+        args.output.write_text(json.dumps(results, indent=2))
+        print(f"Written to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
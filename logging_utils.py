@@ -1,5 +1,9 @@
+import time
+import queue
 import logging
+import logging.handlers
 import enum
+import typing
 from ad_low_noise_float_2023.ad import LOGGER_NAME
 
 logger = logging.getLogger(LOGGER_NAME)
@@ -23,6 +27,157 @@ class EnumMixin:
         except KeyError as e:
             raise Exception(err) from e
 
+
+class PhaseTimer:
+    """
+    Measures the duration of consecutive phases.
+
+    timer = PhaseTimer()
+    connect()
+    timer.phase("connect")
+    logger.info(f"reconnect: {timer}")
+    """
+
+    def __init__(self, begin_s: typing.Optional[float] = None):
+        """
+        begin_s: time.monotonic() of the begin of the first phase. Defaults to now.
+        """
+        self.begin_s = time.monotonic() if begin_s is None else begin_s
+        self._last_s = self.begin_s
+        self.phases: typing.List[typing.Tuple[str, float]] = []
+
+    def phase(self, name: str) -> float:
+        """
+        Ends the current phase and returns its duration.
+        """
+        now_s = time.monotonic()
+        duration_s = now_s - self._last_s
+        self._last_s = now_s
+        self.phases.append((name, duration_s))
+        return duration_s
+
+    @property
+    def total_s(self) -> float:
+        return self._last_s - self.begin_s
+
+    def __str__(self) -> str:
+        elements = [f"{name}={duration_s:0.3f}s" for name, duration_s in self.phases]
+        elements.append(f"total={self.total_s:0.3f}s")
+        return " ".join(elements)
+
+
+class ChunkSummary:
+    """
+    For the hot path: Aggregates the chunks and logs one summary per 'interval_s'.
+    If the level is not enabled, 'add()' returns immediately.
+    """
+
+    def __init__(
+        self,
+        logger_: logging.Logger,
+        name: str,
+        level: int = logging.INFO,
+        interval_s: float = 1.0,
+    ):
+        self.logger = logger_
+        self.name = name
+        self.level = level
+        self.interval_s = interval_s
+        self._begin_s = time.monotonic()
+        self._chunks = 0
+        self._samples = 0
+
+    def add(self, samples: int) -> None:
+        if not self.logger.isEnabledFor(self.level):
+            return
+        self._chunks += 1
+        self._samples += samples
+        duration_s = time.monotonic() - self._begin_s
+        if duration_s < self.interval_s:
+            return
+        self.logger.log(
+            self.level,
+            "%s: %d chunks, %d samples in %0.1fs",
+            self.name,
+            self._chunks,
+            self._samples,
+            duration_s,
+        )
+        self._begin_s += duration_s
+        self._chunks = 0
+        self._samples = 0
+
+
+ASYNC_LOGGER_NAMES = ("", "LabberDriver", LOGGER_NAME)
+"""
+The handlers of these loggers are moved behind the queue. "": The root logger.
+"""
+
+_queue_listener: typing.Optional[logging.handlers.QueueListener] = None
+_queue_handlers: typing.Dict[
+    str, typing.Tuple[logging.Handler, typing.List[logging.Handler]]
+] = {}
+"logger name -> (QueueHandler, original handlers)"
+
+
+def set_logging_async(enabled: bool) -> None:
+    """
+    If enabled, the handlers are moved behind a queue:
+    The I/O (console, files) happens in the thread of the QueueListener and
+    not in the acquisition thread.
+    """
+    global _queue_listener  # pylint: disable=global-statement
+    if enabled == (_queue_listener is not None):
+        return
+
+    if enabled:
+        log_queue: queue.Queue = queue.Queue(-1)
+        for name in ASYNC_LOGGER_NAMES:
+            logger_ = logging.getLogger(name)
+            handlers = list(logger_.handlers)
+            if len(handlers) == 0:
+                continue
+            for handler in handlers:
+                logger_.removeHandler(handler)
+            queue_handler = _LoggerQueueHandler(log_queue, handlers=handlers)
+            logger_.addHandler(queue_handler)
+            _queue_handlers[name] = (queue_handler, handlers)
+        _queue_listener = _QueueListener(log_queue)
+        _queue_listener.start()
+        return
+
+    for name, (queue_handler, handlers) in _queue_handlers.items():
+        logger_ = logging.getLogger(name)
+        logger_.removeHandler(queue_handler)
+        for handler in handlers:
+            logger_.addHandler(handler)
+    _queue_handlers.clear()
+    _queue_listener.stop()
+    _queue_listener = None
+
+
+class _LoggerQueueHandler(logging.handlers.QueueHandler):
+    """
+    Remembers the original handlers of its logger: The listener passes the record
+    to the handlers of the logger the record was logged to.
+    """
+
+    def __init__(self, log_queue: queue.Queue, handlers: typing.List[logging.Handler]):
+        super().__init__(log_queue)
+        self.handlers = handlers
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        self.queue.put_nowait((self.handlers, record))
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def handle(self, record) -> None:
+        handlers, record = record
+        for handler in handlers:
+            if record.levelno >= handler.level:
+                handler.handle(record)
+
+
 class EnumLogging(EnumMixin, enum.Enum):
     DEBUG = "DEBUG"
     INFO = "INFO"
@@ -35,12 +190,13 @@ class EnumLogging(EnumMixin, enum.Enum):
             EnumLogging.WARNING: logging.WARNING,
         }[self]
 
+
 def performSetValue(quant, value):
     """
     Returns the new value.
     Returns None if quant.name does not match.
     """
-    logging.debug(f"value={repr(value)}")
+    logging.debug("value=%r", value)
     if quant.name == "Logging Driver":
         # logging_text = quant.getValueString()
         logger_labber = logging.getLogger("LabberDriver")
@@ -48,6 +204,10 @@ def performSetValue(quant, value):
         logger_labber.setLevel(logging_level.getLoggingLevel())
         return value
 
+    if quant.name == "Logging async":
+        set_logging_async(enabled=bool(value))
+        return value
+
     if quant.name == "Logging AD":
         # logging_text = quant.getValueString()
         logging_level = EnumLogging.get_exception(value)
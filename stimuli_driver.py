@@ -33,6 +33,7 @@ class Driver(InstrumentDriver.InstrumentWorker):
         self.pico: stimuli_utils.PicoStimuli | None = None
         self.run_synchron: bool = False
         self.do_validate: bool = False
+        self.use_timeline: bool = False
 
     def performOpen(self, options={}):
         """Perform the operation of opening the instrument connection"""
@@ -82,6 +83,20 @@ class Driver(InstrumentDriver.InstrumentWorker):
                 scenario=round(value),
                 run_synchron=self.run_synchron,
                 do_validate=self.do_validate,
+                use_timeline=self.use_timeline,
+            )
+            return value
+
+        if quant.name == "Replay":
+            self.use_timeline = value == "TIMELINE"
+            return value
+
+        if quant.name == "Scenario sequence":
+            self.pico.run_sequence(
+                text=value,
+                run_synchron=self.run_synchron,
+                do_validate=self.do_validate,
+                use_timeline=self.use_timeline,
             )
             return value
 
@@ -115,5 +130,10 @@ class Driver(InstrumentDriver.InstrumentWorker):
         #     # for other quantities, just return current value of control
         #     return quant.getValue()
 
+        if quant.name == "Second core wait":
+            if self.pico is None:
+                return 0.0
+            return self.pico.second_core_wait_s
+
         # just return the quantity value
         return quant.getValue()
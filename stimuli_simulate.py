@@ -0,0 +1,130 @@
+"""
+Simulates the stimuli pico on the host: The expected traces of the AD.
+
+The scenarios are compiled into timelines ('stimuli_timeline') and sampled
+at the sample rate of the AD: 'IN_voltage', 'IN_disable' and 'IN_t' as seen by 'AdThread'.
+The arrays may be replayed by 'ad_source.ArraySource' or fed into 'Acquistion' directly.
+
+The simulation is ideal: No delay between the pins and the AD, no noise (see 'noise_V').
+"""
+
+from __future__ import annotations
+import math
+import typing
+import dataclasses
+
+import numpy as np
+
+from ad_low_noise_float_2023.constants import RegisterFilter1
+
+from ad_source import ArraySource
+from stimuli_timeline import (
+    GPIO_IN_DISABLE,
+    GPIO_IN_T,
+    GPIO_SPANNUNG_0,
+    GPIO_SPANNUNG_1,
+    GPIOS,
+    Timeline,
+)
+
+VOLTAGES_V = {
+    (False, False): 0.0,
+    (False, True): 0.7,
+    (True, True): 1.4,
+    (True, False): 0.7,
+}
+"""
+(GPIO16, GPIO17) -> IN_voltage.
+'init.Ctx' never sets (True, False): Assumed to be 0.7V.
+"""
+
+INITIAL_PINS: typing.Dict[int, bool] = {gpio: False for gpio in GPIOS}
+"All pins are cleared by 'init.py'."
+
+
+@dataclasses.dataclass
+class Simulation:
+    sps: float
+    IN_voltage: np.ndarray
+    IN_disable: np.ndarray
+    IN_t: np.ndarray
+    pins: typing.Dict[int, bool]
+    "The pins after the last sample: The start of the next simulation."
+
+    @property
+    def samples(self) -> int:
+        return len(self.IN_voltage)
+
+    def array_source(self, **kwargs) -> ArraySource:
+        return ArraySource(
+            IN_voltage=self.IN_voltage,
+            IN_disable=self.IN_disable,
+            IN_t=self.IN_t,
+            **kwargs,
+        )
+
+
+def simulate(
+    timelines: typing.Sequence[Timeline],
+    register_filter1: RegisterFilter1,
+    pins: typing.Optional[typing.Dict[int, bool]] = None,
+    tail_s: float = 0.0,
+    noise_V: float = 0.0,
+    seed: int = 0,
+) -> Simulation:
+    """
+    Runs the timelines one after the other and samples the pins.
+    A pin change at time t is seen by the first sample at or after t.
+
+    pins: The pins before the first timeline. Default: 'INITIAL_PINS'.
+    tail_s: Samples appended after the last timeline.
+
+    >>> from stimuli_timeline import compile_scenario
+    >>> timeline = compile_scenario(lambda ctx: (ctx.wait_ms(1), ctx.enable(), ctx.IN_P_1V4(), ctx.wait_ms(1)))
+    >>> simulation = simulate([timeline], RegisterFilter1.SPS_03052, pins={gpio: True for gpio in GPIOS})
+    >>> simulation.IN_disable.astype(int)
+    array([1, 1, 1, 1, 0, 0, 0])
+    """
+    sps = register_filter1.SPS
+    pins = dict(INITIAL_PINS if pins is None else pins)
+
+    # Per gpio: The sample index where the value changes and the new value
+    change_idx: typing.Dict[int, typing.List[int]] = {gpio: [0] for gpio in GPIOS}
+    change_value: typing.Dict[int, typing.List[bool]] = {
+        gpio: [pins[gpio]] for gpio in GPIOS
+    }
+    begin_us = 0
+    for timeline in timelines:
+        for event in timeline.events:
+            idx = math.ceil((begin_us + event.time_us) * sps / 1e6)
+            for gpio in GPIOS:
+                value = event.value(gpio, before=pins[gpio])
+                if value != pins[gpio]:
+                    pins[gpio] = value
+                    change_idx[gpio].append(idx)
+                    change_value[gpio].append(value)
+        begin_us += timeline.duration_us
+    samples = max(1, math.ceil((begin_us / 1e6 + tail_s) * sps))
+
+    idx = np.arange(samples)
+
+    def trace(gpio: int) -> np.ndarray:
+        # The last change at or before the sample
+        position = np.searchsorted(change_idx[gpio], idx, side="right") - 1
+        return np.array(change_value[gpio], dtype=bool)[position]
+
+    spannung_0 = trace(GPIO_SPANNUNG_0)
+    spannung_1 = trace(GPIO_SPANNUNG_1)
+    IN_voltage = np.zeros(samples, dtype=np.float64)
+    for (value_0, value_1), voltage_V in VOLTAGES_V.items():
+        IN_voltage[(spannung_0 == value_0) & (spannung_1 == value_1)] = voltage_V
+    if noise_V > 0.0:
+        IN_voltage += np.random.default_rng(seed).normal(scale=noise_V, size=samples)
+
+    return Simulation(
+        sps=sps,
+        IN_voltage=IN_voltage,
+        IN_disable=trace(GPIO_IN_DISABLE),
+        IN_t=trace(GPIO_IN_T),
+        pins=pins,
+    )
@@ -0,0 +1,189 @@
+"""
+Regression test without hardware: Every scenario with an 'Expected' section is simulated
+('stimuli_simulate') and captured by 'ad_thread.Acquistion' at every sample rate.
+The result is compared with the values in the comment of the scenario:
+
+    # Prepare
+    #   duration_max_s=5
+    #   scenario=03
+    #
+    # Expected
+    #   enable_end_detected=True
+    #   enable_s=2s
+
+'scenario=xx' is run before the arm point to prepare the pins.
+
+    python stimuli_simulate_all_scenarios.py
+
+'test_stimuli_simulate.py' runs the same checks with pytest.
+"""
+
+from __future__ import annotations
+import re
+import sys
+import math
+import time
+import pathlib
+import threading
+import typing
+
+from ad_low_noise_float_2023.constants import RegisterFilter1
+
+import ad_thread
+from ad_source import SyntheticMeasurements
+from stimuli_simulate import Simulation, simulate
+from stimuli_timeline import Timeline, compile_all, find_scenarios
+
+RE_COMMENT = re.compile(r"^#\s+(?P<key>\w+)=(?P<value>\S+)\s*$")
+
+SETTLE_S = 0.2
+"Between the prepare scenario and the arm point"
+
+CHUNK_SAMPLES = 1000
+
+TOLERANCE_SAMPLES = 2
+
+
+def parse_comments(
+    filename: pathlib.Path,
+) -> typing.Tuple[typing.Dict[str, str], typing.Dict[str, str]]:
+    """
+    Returns the 'key=value' lines of the sections 'Prepare' and 'Expected'.
+    """
+    sections: typing.Dict[str, typing.Dict[str, str]] = {
+        "Prepare": {},
+        "Expected": {},
+    }
+    section: typing.Optional[typing.Dict[str, str]] = None
+    for line in filename.read_text().splitlines():
+        if not line.startswith("#"):
+            section = None
+            continue
+        title = line[1:].strip()
+        if title in sections:
+            section = sections[title]
+            continue
+        match = RE_COMMENT.match(line)
+        if (section is not None) and (match is not None):
+            section[match.group("key")] = match.group("value")
+    return sections["Prepare"], sections["Expected"]
+
+
+def capture(
+    simulation: Simulation, idx0_arm: int, duration_max_s: float
+) -> ad_thread.ShotResult:
+    """
+    Feeds the samples into 'Acquistion' the same way as 'AdThread' does.
+    The shot is armed before sample 'idx0_arm'.
+    """
+    acquisition = ad_thread.Acquistion()
+    acquisition.set_SPS(next(r for r in RegisterFilter1 if r.SPS == simulation.sps))
+    acquisition.duration_max_s = duration_max_s
+
+    def chunk(begin: int, end: int) -> SyntheticMeasurements:
+        return SyntheticMeasurements(
+            adc_value_V=simulation.IN_voltage[begin:end],
+            IN_disable=simulation.IN_disable[begin:end],
+            IN_t=simulation.IN_t[begin:end],
+        )
+
+    for begin in range(0, idx0_arm, CHUNK_SAMPLES):
+        acquisition.append_pretrigger(
+            chunk(begin, min(begin + CHUNK_SAMPLES, idx0_arm))
+        )
+
+    results: typing.List[ad_thread.ShotResult] = []
+    labber = threading.Thread(
+        target=lambda: results.append(
+            acquisition.wait_for_acquisition(idx0_start_capturing=0)
+        ),
+        daemon=True,
+    )
+    labber.start()
+    while acquisition.state is not ad_thread.State.CAPTURING:
+        time.sleep(0.001)
+
+    for begin in range(idx0_arm, simulation.samples, CHUNK_SAMPLES):
+        if acquisition.state is not ad_thread.State.CAPTURING:
+            break
+        acquisition.append(chunk(begin, begin + CHUNK_SAMPLES))
+        acquisition.found_raising_edge()
+    labber.join(timeout=10.0)
+    assert len(results) == 1, "The shot did not complete"
+    return results[0]
+
+
+def compare(
+    result: ad_thread.ShotResult, expected: typing.Dict[str, str]
+) -> typing.List[str]:
+    """
+    Returns the differences.
+    """
+    differences = []
+    for key, text in expected.items():
+        value = getattr(result, key)
+        if text in ("True", "False"):
+            ok = value == (text == "True")
+        else:
+            tolerance_s = TOLERANCE_SAMPLES / result.sps
+            ok = abs(value - float(text.rstrip("s"))) <= tolerance_s
+        if not ok:
+            differences.append(f"{key}={value} expected {text}")
+    return differences
+
+
+def check_scenario(
+    scenario_id: int,
+    register_filter1: RegisterFilter1,
+    timelines: typing.Dict[int, Timeline],
+) -> typing.List[str]:
+    """
+    Simulates the scenario and returns the differences to its 'Expected' section.
+    """
+    prepare, expected = parse_comments(find_scenarios()[scenario_id])
+    assert len(expected) > 0, f"Scenario {scenario_id} has no 'Expected' section"
+    duration_max_s = float(prepare.get("duration_max_s", "5"))
+    prepare_id = int(prepare.get("scenario", "03"))
+    settle = Timeline(events=(), duration_us=int(1e6 * SETTLE_S))
+    arm_us = timelines[prepare_id].duration_us + settle.duration_us
+    simulation = simulate(
+        [timelines[prepare_id], settle, timelines[scenario_id]],
+        register_filter1=register_filter1,
+        tail_s=duration_max_s + 1.0,
+    )
+    result = capture(
+        simulation,
+        idx0_arm=math.ceil(arm_us * register_filter1.SPS / 1e6),
+        duration_max_s=duration_max_s,
+    )
+    return compare(result, expected)
+
+
+def scenarios_expected() -> typing.List[int]:
+    """
+    Returns the ids of the scenarios with an 'Expected' section.
+    """
+    return [
+        scenario_id
+        for scenario_id, filename in find_scenarios().items()
+        if len(parse_comments(filename)[1]) > 0
+    ]
+
+
+def main() -> int:
+    timelines = compile_all()
+    failures = 0
+    for scenario_id in scenarios_expected():
+        filename = find_scenarios()[scenario_id]
+        for register_filter1 in RegisterFilter1:
+            differences = check_scenario(scenario_id, register_filter1, timelines)
+            failures += len(differences) > 0
+            print(
+                f"{filename.name} {register_filter1.name}: {'FAILED ' + ', '.join(differences) if differences else 'OK'}"
+            )
+    print(f"{failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
-from machine import Pin
+from machine import Pin, mem32
+from array import array
 
 import time
 import _thread
@@ -96,32 +97,252 @@ def scenario(ctx: CtxBase):
     ctx.log("Empty, may be overridden")
 
 
+SCENARIOS = {}
+"""
+scenario id -> function 'scenario(ctx)'.
+Uploaded once by the host, see 'stimuli_utils.PicoStimuli'.
+"""
+
+TIMELINES = {}
+"""
+scenario id -> (times_us, set_masks, clear_masks), compiled by the host: See 'stimuli_timeline.py'.
+The last entry marks the end of the scenario.
+"""
+
+RUNTIME_HASH = None
+"""
+Hash of this file and all scenarios. Set by the host after the upload:
+If it matches, the host does not upload again.
+"""
+
+
+SECOND_CORE_TIMEOUT_MS = 60_000
+
+_scenario_running = False
+"True while a scenario runs on the second core."
+
+
 def second_core_is_ready() -> bool:
     """
     return True if second core is ready.
     If not, wait and try again.
     """
+    return not _scenario_running
+
+
+def _run_second_core(func, ctx) -> None:
+    global _scenario_running
     try:
-        _thread.start_new_thread(lambda: None, ())
-        return True
-    except OSError:
-        return False
+        func(ctx)
+    finally:
+        _scenario_running = False
+
+
+def _start_second_core(func, ctx, timeout_ms: int) -> int:
+    """
+    Waits for the scenario before to complete and starts 'func' on the second core.
+    Returns the time waited in ms.
+    """
+    global _scenario_running
+    begin_ms = time.ticks_ms()
+    while True:
+        waited_ms = time.ticks_diff(time.ticks_ms(), begin_ms)
+        if not _scenario_running:
+            _scenario_running = True
+            try:
+                _thread.start_new_thread(_run_second_core, (func, ctx))
+                return waited_ms
+            except OSError:
+                # The thread before just returned: The core is released shortly
+                _scenario_running = False
+        if waited_ms > timeout_ms:
+            raise OSError(
+                f"Second core not ready after {waited_ms}ms. Powercycle the stimuli-pico!"
+            )
+        time.sleep_ms(1)
 
 
 def run_scenario(run_synchron: bool, do_validate: bool, do_log: bool = False):
+    """
+    Runs the scenario last defined by 'scenario_xx.py'.
+    """
+    _run(scenario, run_synchron=run_synchron, do_validate=do_validate, do_log=do_log)
+
+
+def run(
+    scenario_id: int,
+    run_synchron: bool = False,
+    do_validate: bool = False,
+    do_log: bool = False,
+    timeout_ms: int = SECOND_CORE_TIMEOUT_MS,
+):
+    """
+    Runs a scenario of 'SCENARIOS'.
+    The scenario is validated first (dry run with 'CtxBase'): No pin is set if it fails.
+    Asynchron: Waits up to 'timeout_ms' for the scenario before and prints 'waited_ms=xx'.
+    """
+    assert isinstance(scenario_id, int)
+    func = SCENARIOS.get(scenario_id, None)
+    if func is None:
+        raise ValueError(f"Scenario {scenario_id} not uploaded: {sorted(SCENARIOS)}")
+    if not do_validate:
+        func(CtxBase(do_log=False))
+    _run(
+        func,
+        run_synchron=run_synchron,
+        do_validate=do_validate,
+        do_log=do_log,
+        timeout_ms=timeout_ms,
+    )
+
+
+def run_sequence(
+    steps,
+    run_synchron: bool = False,
+    do_validate: bool = False,
+    do_log: bool = False,
+    timeout_ms: int = SECOND_CORE_TIMEOUT_MS,
+):
+    """
+    steps: A list of (scenario_id, repetitions, delay_ms).
+    Runs all scenarios as one: 'delay_ms' is waited after every repetition.
+    All scenarios are validated first (dry run with 'CtxBase').
+    """
+    funcs = []
+    for scenario_id, repetitions, delay_ms in steps:
+        func = SCENARIOS.get(scenario_id, None)
+        if func is None:
+            raise ValueError(
+                f"Scenario {scenario_id} not uploaded: {sorted(SCENARIOS)}"
+            )
+        assert repetitions >= 1
+        assert isinstance(delay_ms, int)
+        funcs.append((func, repetitions, delay_ms))
+
+    def sequence(ctx):
+        for func, repetitions, delay_ms in funcs:
+            for _ in range(repetitions):
+                func(ctx)
+                if delay_ms > 0:
+                    ctx.wait_ms(delay_ms)
+
+    if not do_validate:
+        sequence(CtxBase(do_log=False))
+    _run(
+        sequence,
+        run_synchron=run_synchron,
+        do_validate=do_validate,
+        do_log=do_log,
+        timeout_ms=timeout_ms,
+    )
+
+
+SIO_GPIO_OUT = 0xD0000010
+SIO_GPIO_OUT_XOR = 0xD000001C
+TIMELINE_SPIN_MS = 2
+"Sleep until this time before the next event, then spin on 'ticks_us()'."
+
+
+def _play_timeline(timeline) -> None:
+    times_us, set_masks, clear_masks = timeline
+    begin_us = time.ticks_us()
+    for i in range(len(times_us)):
+        deadline_us = time.ticks_add(begin_us, times_us[i])
+        # Only this loop writes the pins: The toggles may be calculated before the deadline
+        out = mem32[SIO_GPIO_OUT]
+        xor_mask = (set_masks[i] & ~out) | (clear_masks[i] & out)
+        remaining_ms = time.ticks_diff(deadline_us, time.ticks_us()) // 1000
+        if remaining_ms > TIMELINE_SPIN_MS:
+            time.sleep_ms(remaining_ms - TIMELINE_SPIN_MS)
+        while time.ticks_diff(deadline_us, time.ticks_us()) > 0:
+            pass
+        # One store: All pins of an event change at the same time
+        mem32[SIO_GPIO_OUT_XOR] = xor_mask
+
+
+def run_timeline(
+    scenario_id: int,
+    run_synchron: bool = False,
+    timeout_ms: int = SECOND_CORE_TIMEOUT_MS,
+):
+    """
+    Replays the timeline of a scenario: The edges do not depend on the interpreter.
+    """
+    assert isinstance(scenario_id, int)
+    timeline = TIMELINES.get(scenario_id, None)
+    if timeline is None:
+        raise ValueError(f"Timeline {scenario_id} not uploaded: {sorted(TIMELINES)}")
+    if run_synchron:
+        _play_timeline(timeline)
+        return
+    waited_ms = _start_second_core(_play_timeline, timeline, timeout_ms=timeout_ms)
+    print(f"waited_ms={waited_ms}")
+
+
+def _sequence_timeline(steps):
+    """
+    steps: A list of (scenario_id, repetitions, delay_ms), see 'run_sequence()'.
+    Returns one timeline: The timelines of the scenarios one after the other.
+    """
+    times_us = array("I")
+    set_masks = array("I")
+    clear_masks = array("I")
+    offset_us = 0
+    for scenario_id, repetitions, delay_ms in steps:
+        timeline = TIMELINES.get(scenario_id, None)
+        if timeline is None:
+            raise ValueError(
+                f"Timeline {scenario_id} not uploaded: {sorted(TIMELINES)}"
+            )
+        assert repetitions >= 1
+        assert isinstance(delay_ms, int)
+        step_times_us, step_set_masks, step_clear_masks = timeline
+        for _ in range(repetitions):
+            # The last entry marks the end of the scenario
+            for i in range(len(step_times_us) - 1):
+                times_us.append(offset_us + step_times_us[i])
+                set_masks.append(step_set_masks[i])
+                clear_masks.append(step_clear_masks[i])
+            offset_us += step_times_us[-1] + 1000 * delay_ms
+    times_us.append(offset_us)
+    set_masks.append(0)
+    clear_masks.append(0)
+    return times_us, set_masks, clear_masks
+
+
+def run_sequence_timeline(
+    steps,
+    run_synchron: bool = False,
+    timeout_ms: int = SECOND_CORE_TIMEOUT_MS,
+):
+    """
+    Like 'run_sequence()', but replays the timelines: The edges do not depend on the interpreter.
+    """
+    timeline = _sequence_timeline(steps)
+    if run_synchron:
+        _play_timeline(timeline)
+        return
+    waited_ms = _start_second_core(_play_timeline, timeline, timeout_ms=timeout_ms)
+    print(f"waited_ms={waited_ms}")
+
+
+def _run(
+    func,
+    run_synchron: bool,
+    do_validate: bool,
+    do_log: bool,
+    timeout_ms: int = SECOND_CORE_TIMEOUT_MS,
+):
     assert isinstance(run_synchron, bool)
     assert isinstance(do_validate, bool)
     assert isinstance(do_log, bool)
     ctx = CtxBase(do_log=do_log) if do_validate else Ctx(do_log=do_log)
     ctx.log(f"run_scenario({run_synchron=}, {do_validate=})")
     if run_synchron:
-        scenario(ctx=ctx)
+        func(ctx=ctx)
     else:
-        try:
-            _thread.start_new_thread(scenario, (ctx,))
-        except OSError as e:
-            print(f"Wait for second core: {e}")
-            raise
+        waited_ms = _start_second_core(func, ctx, timeout_ms=timeout_ms)
+        print(f"waited_ms={waited_ms}")
 
     ctx.log("run_scenario() DONE")
 
@@ -1,5 +1,6 @@
 # Prepare
 #   duration_max_s=5
+#   scenario=03
 #
 # Expected
 #   timeout_detected=True
@@ -1,5 +1,6 @@
 # Prepare
 #   duration_max_s=5
+#   scenario=00
 #
 # Expected
 #   enable_end_detected=True
@@ -1,5 +1,6 @@
 # Prepare
 #   duration_max_s=5
+#   scenario=03
 #
 # Expected
 #   enable_start_detected=True
@@ -13,7 +14,7 @@ def scenario(ctx):
     ctx.wait_ms(time_ms)
 
     ctx.enable()
-    
+
     ctx.wait_ms(time_ms)
 
     ctx.IN_P_0V7()
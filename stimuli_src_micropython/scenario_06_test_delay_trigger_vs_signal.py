@@ -4,12 +4,13 @@
 #
 # Prepare
 #   duration_max_s=5
+#   scenario=03
 #
 # Expected
 #   enable_start_detected=True
 #   enable_end_detected=True
-#   enable_start_s=0.1s
-#   enable_s=0.5s
+#   enable_start_s=0.3s
+#   enable_s=0.006s
 #
 def scenario(ctx):
 
@@ -0,0 +1,228 @@
+"""
+Compiles the scenarios of 'stimuli_src_micropython' into a pin timeline on the host.
+
+A scenario is executed against 'TimelineCtx' which records every pin change with its time.
+The result is a flat list of events (time_us, pins to set, pins to clear) which the pico
+replays in a tight loop ('init.run_timeline()'): No interpreter overhead between the edges.
+
+This module does not depend on 'mpfshell': The simulator uses the timelines as well.
+
+    python stimuli_timeline.py
+"""
+
+from __future__ import annotations
+import re
+import ast
+import typing
+import pathlib
+import dataclasses
+
+DIRECTORY_OF_THIS_FILE = pathlib.Path(__file__).absolute().parent
+DIRECTORY_MICROPYTHON = DIRECTORY_OF_THIS_FILE / "stimuli_src_micropython"
+
+RE_SCENARIO = re.compile(r"^scenario_(?P<scenario_id>\d+)_.*\.py$")
+
+GPIO_SPANNUNG_0 = 16
+GPIO_SPANNUNG_1 = 17
+GPIO_IN_DISABLE = 20
+GPIO_IN_T = 21
+GPIOS = (GPIO_SPANNUNG_0, GPIO_SPANNUNG_1, GPIO_IN_DISABLE, GPIO_IN_T)
+
+
+def find_scenarios() -> typing.Dict[int, pathlib.Path]:
+    """
+    Returns scenario id -> filename of 'scenario_xx_*.py'.
+    """
+    scenarios: typing.Dict[int, pathlib.Path] = {}
+    for filename in sorted(DIRECTORY_MICROPYTHON.glob("scenario_*.py")):
+        match = RE_SCENARIO.match(filename.name)
+        if match is None:
+            continue
+        scenario_id = int(match.group("scenario_id"))
+        assert (
+            scenario_id not in scenarios
+        ), f"Scenario {scenario_id} is defined twice: {scenarios[scenario_id].name} and {filename.name}"
+        scenarios[scenario_id] = filename
+    return scenarios
+
+
+@dataclasses.dataclass(frozen=True)
+class Event:
+    time_us: int
+    "Since the start of the scenario"
+    set_mask: int
+    "Bit n: GPIOn is set"
+    clear_mask: int
+    "Bit n: GPIOn is cleared"
+
+    def value(self, gpio: int, before: bool) -> bool:
+        """
+        Returns the value of 'gpio' after this event.
+        """
+        if self.set_mask & (1 << gpio):
+            return True
+        if self.clear_mask & (1 << gpio):
+            return False
+        return before
+
+
+@dataclasses.dataclass(frozen=True)
+class Timeline:
+    """
+    >>> timeline = compile_scenario(lambda ctx: (ctx.enable(), ctx.wait_ms(2), ctx.disable()))
+    >>> timeline.events
+    (Event(time_us=0, set_mask=0, clear_mask=1048576), Event(time_us=2000, set_mask=1048576, clear_mask=0))
+    >>> timeline.duration_us
+    2000
+    """
+
+    events: typing.Tuple[Event, ...]
+    duration_us: int
+    "The scenario may end with a wait: May be later than the last event."
+
+    def micropython(self) -> str:
+        """
+        Returns the compact representation for 'init.TIMELINES'.
+        """
+        times_us = [event.time_us for event in self.events] + [self.duration_us]
+        set_masks = [event.set_mask for event in self.events] + [0]
+        clear_masks = [event.clear_mask for event in self.events] + [0]
+        return f'(array("I", {times_us}), array("I", {set_masks}), array("I", {clear_masks}))'
+
+
+class TimelineCtx:
+    """
+    Records the pins written by a scenario.
+    Mirrors the pin logic of 'init.Ctx': 'assert_in_sync()' checks the method names.
+    """
+
+    def __init__(self) -> None:
+        self.do_log = False
+        self.sleep_total_ms = 0
+        self._pins: typing.Dict[int, typing.Dict[int, bool]] = {}
+        "time_us -> gpio -> value. The last value written at a given time wins."
+
+    def _pin(self, gpio: int, v: typing.Union[bool, int]) -> None:
+        self._pins.setdefault(1000 * self.sleep_total_ms, {})[gpio] = bool(v)
+
+    def disable(self):
+        self.IN_disable(True)
+
+    def enable(self):
+        self.IN_disable(False)
+
+    def IN_disable(self, v):
+        assert isinstance(v, bool)
+        self._pin(GPIO_IN_DISABLE, v)
+
+    def IN_t(self, v):
+        assert isinstance(v, bool)
+        self._pin(GPIO_IN_T, v)
+
+    def IN_P_0V0(self) -> None:
+        self._pin(GPIO_SPANNUNG_0, 0)
+        self._pin(GPIO_SPANNUNG_1, 0)
+
+    def IN_P_0V7(self) -> None:
+        self._pin(GPIO_SPANNUNG_0, 0)
+        self._pin(GPIO_SPANNUNG_1, 1)
+
+    def IN_P_0V7_t_up_down(self) -> None:
+        self._pin(GPIO_SPANNUNG_0, 0)
+        self._pin(GPIO_SPANNUNG_1, 0)
+        self._pin(GPIO_IN_T, 1)
+        self._pin(GPIO_SPANNUNG_1, 1)
+        self.wait_ms(2)
+        self._pin(GPIO_SPANNUNG_1, 0)
+        self._pin(GPIO_IN_T, 0)
+
+    def IN_P_0V7_t_down(self) -> None:
+        pass
+
+    def IN_P_1V4(self) -> None:
+        self._pin(GPIO_SPANNUNG_0, 1)
+        self._pin(GPIO_SPANNUNG_1, 1)
+
+    def wait_s(self, s):
+        assert isinstance(s, (int, float))
+        self.wait_ms(int(1000 * s))
+
+    def wait_ms(self, ms):
+        assert isinstance(ms, int)
+        self.sleep_total_ms += ms
+
+    def log(self, msg: str) -> None:
+        pass
+
+    def timeline(self) -> Timeline:
+        events = []
+        for time_us in sorted(self._pins):
+            set_mask = clear_mask = 0
+            for gpio, value in self._pins[time_us].items():
+                if value:
+                    set_mask |= 1 << gpio
+                else:
+                    clear_mask |= 1 << gpio
+            events.append(
+                Event(time_us=time_us, set_mask=set_mask, clear_mask=clear_mask)
+            )
+        return Timeline(events=tuple(events), duration_us=1000 * self.sleep_total_ms)
+
+
+def assert_in_sync() -> None:
+    """
+    Raises if 'init.CtxBase' has methods 'TimelineCtx' does not know.
+    """
+    tree = ast.parse((DIRECTORY_MICROPYTHON / "init.py").read_text())
+    for node in tree.body:
+        if isinstance(node, ast.ClassDef) and node.name in ("CtxBase", "Ctx"):
+            for method in node.body:
+                if isinstance(method, ast.FunctionDef):
+                    assert hasattr(
+                        TimelineCtx, method.name
+                    ), f"TimelineCtx: Method '{method.name}' of 'init.{node.name}' is missing"
+
+
+def compile_scenario(scenario: typing.Callable[[TimelineCtx], None]) -> Timeline:
+    ctx = TimelineCtx()
+    scenario(ctx)
+    return ctx.timeline()
+
+
+def load_scenario(filename: pathlib.Path) -> typing.Callable[[TimelineCtx], None]:
+    """
+    Executes 'scenario_xx_*.py' and returns its function 'scenario(ctx)'.
+    """
+    namespace: typing.Dict[str, typing.Any] = {}
+    exec(compile(filename.read_text(), str(filename), "exec"), namespace)
+    return namespace["scenario"]
+
+
+def compile_all() -> typing.Dict[int, Timeline]:
+    """
+    Returns scenario id -> Timeline.
+    """
+    assert_in_sync()
+    return {
+        scenario_id: compile_scenario(load_scenario(filename))
+        for scenario_id, filename in find_scenarios().items()
+    }
+
+
+def main():
+    for scenario_id, timeline in compile_all().items():
+        print(
+            f"scenario {scenario_id:02d}: {len(timeline.events)} events, {timeline.duration_us}us"
+        )
+        for event in timeline.events:
+            elements = [f"  {event.time_us:10d}us"]
+            for gpio in GPIOS:
+                if event.set_mask & (1 << gpio):
+                    elements.append(f"GPIO{gpio}=1")
+                if event.clear_mask & (1 << gpio):
+                    elements.append(f"GPIO{gpio}=0")
+            print(" ".join(elements))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,15 @@
+import re
 import sys
-import time
+import typing
+import hashlib
 import pathlib
 import logging
+import tempfile
 
 from ad_low_noise_float_2023.ad import LOGGER_NAME
 
+from stimuli_timeline import DIRECTORY_MICROPYTHON, compile_all, find_scenarios
+
 logger = logging.getLogger(LOGGER_NAME)
 
 DIRECTORY_OF_THIS_FILE = pathlib.Path(__file__).absolute().parent
@@ -18,6 +23,13 @@ PYTHON_VERSION = (
 
 MICROYPTHON_EXEC_TIMEOUT_S = 65
 
+SECOND_CORE_TIMEOUT_S = 60.0
+"""
+The pico waits this long for the scenario before. Shorter than 'MICROYPTHON_EXEC_TIMEOUT_S'.
+"""
+
+RE_WAITED_MS = re.compile(rb"waited_ms=(?P<waited_ms>\d+)")
+
 
 def assert_correct_python_version():
     if PYTHON_VERSION != REQUIRED_PYTHON_VERSION:
@@ -42,12 +54,84 @@ if mp.version.FULL < REQUIRED_MPFSHELL_VERSION:
         f'Your "mpfshell" has version "{mp.version.FULL}" but should be higher than "{REQUIRED_MPFSHELL_VERSION}". Call "pip install --upgrade mpfshell2"!'
     )
 
-DIRECTORY_MICROPYTHON = DIRECTORY_OF_THIS_FILE / "stimuli_src_micropython"
 assert (
     DIRECTORY_MICROPYTHON.is_dir()
 ), f"Directory does not exist: {DIRECTORY_MICROPYTHON}"
 
 
+def runtime_hash(scenarios: typing.Dict[int, pathlib.Path]) -> str:
+    """
+    Changes if 'init.py' or any scenario changes.
+    """
+    h = hashlib.sha256()
+    for filename in [
+        DIRECTORY_MICROPYTHON / "init.py",
+        DIRECTORY_OF_THIS_FILE / "stimuli_timeline.py",
+        *scenarios.values(),
+    ]:
+        h.update(filename.name.encode())
+        h.update(filename.read_bytes())
+    return h.hexdigest()[:16]
+
+
+def scenarios_source(scenarios: typing.Dict[int, pathlib.Path], hash_: str) -> str:
+    """
+    Returns the source which registers all scenarios in 'init.SCENARIOS'
+    and their timelines in 'init.TIMELINES'.
+    Every scenario file defines 'scenario()': It is registered before the next file overrides it.
+    """
+    timelines = compile_all()
+    lines: typing.List[str] = []
+    for scenario_id, filename in scenarios.items():
+        lines.append(f"# {filename.name}")
+        lines.append(filename.read_text())
+        lines.append(f"SCENARIOS[{scenario_id}] = scenario")
+        lines.append(
+            f"TIMELINES[{scenario_id}] = {timelines[scenario_id].micropython()}"
+        )
+    lines.append(f"RUNTIME_HASH = {hash_!r}")
+    return "\n".join(lines) + "\n"
+
+
+RE_SEQUENCE_STEP = re.compile(
+    r"^(?P<scenario_id>\d+)(x(?P<repetitions>\d+))?(@(?P<delay_ms>\d+)(ms)?)?$"
+)
+
+
+def parse_sequence(text: str) -> typing.List[typing.Tuple[int, int, int]]:
+    """
+    Parses the quantity 'Scenario sequence':
+    Comma separated steps 'scenario_id[xrepetitions][@delay_ms]'.
+    Returns a list of (scenario_id, repetitions, delay_ms).
+
+    >>> parse_sequence("3, 4x5@200ms, 2@50")
+    [(3, 1, 0), (4, 5, 200), (2, 1, 50)]
+    >>> parse_sequence("")
+    []
+    """
+    steps: typing.List[typing.Tuple[int, int, int]] = []
+    for element in text.split(","):
+        element = element.strip().replace(" ", "")
+        if element == "":
+            continue
+        match = RE_SEQUENCE_STEP.match(element)
+        if match is None:
+            raise ValueError(
+                f'Scenario sequence: Expected "scenario_id[xrepetitions][@delay_ms]" but got "{element}"'
+            )
+        repetitions = int(match.group("repetitions") or 1)
+        if repetitions < 1:
+            raise ValueError(f'Scenario sequence: At least 1 repetition: "{element}"')
+        steps.append(
+            (
+                int(match.group("scenario_id")),
+                repetitions,
+                int(match.group("delay_ms") or 0),
+            )
+        )
+    return steps
+
+
 class PicoStimuli:
     def __init__(self):
         logger.info("Connecting to pico...")
@@ -61,91 +145,124 @@ class PicoStimuli:
         # self.shell.sync_folder(DIRECTORY_OF_THIS_FILE / 'stimuli_src_micropython', FILES_TO_SKIP=['config_identification.py'])
         # # Start the program
         # self.fe.exec_('import micropython_logic')
-        self._execfile(DIRECTORY_MICROPYTHON / "init.py")
+        self.scenarios = find_scenarios()
+        self.second_core_wait_s = 0.0
+        "Time the last scenario waited for the scenario before to complete."
+        self._upload_runtime()
 
         logger.info("Connected to pico!")
 
+    def _upload_runtime(self) -> None:
+        """
+        Uploads 'init.py' and all scenarios once.
+        Skipped if the pico still runs the same code.
+        """
+        hash_ = runtime_hash(self.scenarios)
+        ret = self.fe.eval('globals().get("RUNTIME_HASH")')
+        if ret == repr(hash_).encode():
+            logger.info(f"micropython runtime {hash_} already uploaded")
+            return
+
+        self._execfile(DIRECTORY_MICROPYTHON / "init.py")
+        with tempfile.TemporaryDirectory() as directory:
+            filename = pathlib.Path(directory) / "scenarios.py"
+            filename.write_text(scenarios_source(self.scenarios, hash_=hash_))
+            self._execfile(filename)
+        logger.info(
+            f"micropython runtime {hash_} uploaded: scenarios {sorted(self.scenarios)}"
+        )
+
     def _execfile(self, filename: pathlib.Path) -> None:
         logger.info(f"micropython execfile: {filename.name}")
         rc = self.fe.execfile(filename)
         logger.info(f"micropython execfile: {filename.name} returned {rc}")
 
-    def _exec_raw(self, command: str) -> None:
+    def _exec_raw(self, command: str) -> bytes:
         logger.info(f"micropython _exec_raw('{command}')")
         data, data_err = self.fe.exec_raw(command, timeout=MICROYPTHON_EXEC_TIMEOUT_S)
         msg = f"micropython _exec_raw('{command}') returned: data={data}, data_err={data_err}"
         logger.info(msg)
         if len(data_err) > 0:
             raise ValueError(msg)
+        return data
 
-    def _exec_raw_with_exception_handler(self, command: str) -> None:
+    def _exec_raw_with_exception_handler(self, command: str) -> bytes:
         try:
-            self._exec_raw(command)
+            return self._exec_raw(command)
         except BaseException as e:
             msg = f"micropython exec failed: {command}"
             logger.error(msg)
             logger.exception(e)
             raise
 
-    def _find_scenario(self, scenario: int) -> pathlib.Path:
-        pattern = f"scenario_{scenario:02d}*.py"
-        for _filename in DIRECTORY_MICROPYTHON.glob(pattern=pattern):
-            return _filename
-
-        msg = f"Scenario does not exist: {pattern}"
-        logger.error(msg)
-        return None
-
-    def _wait_for_second_core(self) -> None:
-        begin_s = time.monotonic()
-        while True:
-            ret = self.fe.eval("second_core_is_ready()")
-            duration_s = time.monotonic() - begin_s
-            if duration_s > 10.0:
-                logger.info(f"_wait_for_second_core() returned after {duration_s:0.1f}s")
-            if ret == b"True":
-                return
-            if duration_s > 65.0:
-                msg = f"Second core not ready after {duration_s:0.1f}s. Powercycle the stimuli-pico!"
-                logger.error(msg=msg)
-                raise ValueError(msg)
-            time.sleep(10)
-
     def run_scenario(
         self,
         scenario: int,
         run_synchron: bool,
         do_validate: bool,
+        use_timeline: bool = False,
     ) -> None:
+        """
+        use_timeline: Replay the precompiled timeline (see 'stimuli_timeline').
+          Ignored if 'do_validate': The interpreted scenario is validated.
+        """
 
-        filename = self._find_scenario(scenario=scenario)
+        filename = self.scenarios.get(scenario, None)
         if filename is None:
-            msg = f"Scenario does not exist: {filename}"
+            msg = f"Scenario does not exist: {scenario}"
             logger.error(msg)
-            # return
             raise ValueError(msg)
 
         logger.info(
             f"run_scenario(scenario={scenario}, run_synchron={run_synchron}, do_validate={do_validate}): {filename.name}"
         )
 
-        try:
-            self._execfile(filename)
-        except BaseException as e:
-            msg = f"micropython execfile() failed: {filename.name}"
-            logger.error(msg)
-            logger.exception(e)
-            raise
+        # The scenario is validated on the pico before it runs.
+        # The pico waits for the second core: No polling from the host.
+        timeout_ms = int(1000 * SECOND_CORE_TIMEOUT_S)
+        command = f"run({scenario}, run_synchron={run_synchron}, do_validate={do_validate}, timeout_ms={timeout_ms})"
+        if use_timeline and not do_validate:
+            command = f"run_timeline({scenario}, run_synchron={run_synchron}, timeout_ms={timeout_ms})"
+        data = self._exec_raw_with_exception_handler(command)
+        self._update_second_core_wait(data)
 
-        self._wait_for_second_core()
+    def run_sequence(
+        self,
+        text: str,
+        run_synchron: bool,
+        do_validate: bool,
+        use_timeline: bool = False,
+    ) -> None:
+        """
+        Runs all steps of 'text' (see 'parse_sequence()') in one command on the pico.
+        use_timeline: Replay the precompiled timelines, see 'run_scenario()'.
+        """
+        steps = parse_sequence(text)
+        if len(steps) == 0:
+            return
+        for scenario_id, _repetitions, _delay_ms in steps:
+            if scenario_id not in self.scenarios:
+                msg = f"Scenario sequence '{text}': Scenario does not exist: {scenario_id}"
+                logger.error(msg)
+                raise ValueError(msg)
 
-        self._exec_raw_with_exception_handler(
-            "run_scenario(run_synchron=True, do_validate=True)"
+        logger.info(
+            f"run_sequence({steps}, run_synchron={run_synchron}, do_validate={do_validate}, use_timeline={use_timeline})"
         )
+        timeout_ms = int(1000 * SECOND_CORE_TIMEOUT_S)
+        command = f"run_sequence({steps}, run_synchron={run_synchron}, do_validate={do_validate}, timeout_ms={timeout_ms})"
+        if use_timeline and not do_validate:
+            command = f"run_sequence_timeline({steps}, run_synchron={run_synchron}, timeout_ms={timeout_ms})"
+        data = self._exec_raw_with_exception_handler(command)
+        self._update_second_core_wait(data)
 
-        self._exec_raw_with_exception_handler(
-            f"run_scenario(run_synchron={run_synchron}, do_validate={do_validate})"
+    def _update_second_core_wait(self, data: bytes) -> None:
+        match = RE_WAITED_MS.search(data)
+        self.second_core_wait_s = (
+            0.0 if match is None else int(match.group("waited_ms")) / 1000.0
         )
+        if self.second_core_wait_s > 1.0:
+            logger.info(f"waited {self.second_core_wait_s:0.1f}s for the second core")
 
     def close(self):
         self.board.close()
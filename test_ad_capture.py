@@ -0,0 +1,185 @@
+"""
+Tests of 'ad_capture':
+'EdgeDetector': Edges on the chunk boundaries, on 'np.ndarray' and on 'DigitalArray'.
+'create_shot_directory()': The number of shot directories kept.
+
+    python -m pytest test_ad_capture.py
+"""
+
+from __future__ import annotations
+import typing
+import pathlib
+
+import numpy as np
+import pytest
+
+from ad_capture import (
+    DigitalArray,
+    EdgeDetector,
+    GrowableArray,
+    create_shot_directory,
+)
+
+CHUNK = 4
+
+
+def make_chunks(edges: typing.Dict[int, bool], chunks: int) -> typing.List[np.ndarray]:
+    """
+    Returns 'chunks' chunks of 'CHUNK' samples. 'edges': index -> value from this index on.
+    The samples before the first edge are 1.
+    """
+    samples = np.ones(chunks * CHUNK, dtype=bool)
+    for idx0, value in sorted(edges.items()):
+        samples[idx0:] = value
+    return [samples[i : i + CHUNK] for i in range(0, len(samples), CHUNK)]
+
+
+class Growing:
+    """
+    The array grows chunk by chunk, as while capturing.
+    """
+
+    def __init__(self, digital: bool):
+        self.array: typing.Union[GrowableArray, DigitalArray] = (
+            DigitalArray() if digital else GrowableArray()
+        )
+
+    def append(self, chunk: np.ndarray) -> None:
+        self.array.append(chunk)
+
+    @property
+    def searched(self) -> typing.Union[np.ndarray, DigitalArray]:
+        if isinstance(self.array, DigitalArray):
+            return self.array
+        return self.array.view()
+
+
+def find_per_chunk(
+    chunks: typing.List[np.ndarray], value_to_find: int, digital: bool
+) -> typing.List[typing.Optional[int]]:
+    """
+    Returns the result of 'find_first()' after every chunk.
+    """
+    growing = Growing(digital=digital)
+    detector = EdgeDetector()
+    results = []
+    for chunk in chunks:
+        growing.append(chunk)
+        results.append(detector.find_first(growing.searched, value_to_find))
+    return results
+
+
+@pytest.fixture(params=[False, True], ids=["ndarray", "DigitalArray"])
+def digital(request) -> bool:
+    return request.param
+
+
+def test_edge_on_first_sample_of_chunk(digital: bool):
+    chunks = make_chunks({CHUNK: False}, chunks=3)
+    results = find_per_chunk(chunks, value_to_find=0, digital=digital)
+    assert results == [None, CHUNK, CHUNK]
+
+
+def test_edge_on_last_sample_of_chunk(digital: bool):
+    chunks = make_chunks({CHUNK - 1: False}, chunks=3)
+    results = find_per_chunk(chunks, value_to_find=0, digital=digital)
+    assert results == [CHUNK - 1, CHUNK - 1, CHUNK - 1]
+
+
+def test_edge_on_first_sample_of_stream(digital: bool):
+    chunks = make_chunks({0: False}, chunks=2)
+    results = find_per_chunk(chunks, value_to_find=0, digital=digital)
+    assert results == [0, 0]
+
+
+def test_falling_and_raising_edge_in_same_chunk(digital: bool):
+    falling, raising = CHUNK + 1, CHUNK + 3
+    chunks = make_chunks({falling: False, raising: True}, chunks=3)
+    growing = Growing(digital=digital)
+    detector = EdgeDetector()
+    for chunk in chunks[:2]:
+        growing.append(chunk)
+    assert detector.find_first(growing.searched, value_to_find=0) == falling
+    # The cursor stays on the falling edge: The raising edge is found in the same chunk
+    assert detector.find_first(growing.searched, value_to_find=1) == raising
+    growing.append(chunks[2])
+    assert detector.find_first(growing.searched, value_to_find=1) == raising
+
+
+def test_pulse_of_one_sample_on_chunk_boundary(digital: bool):
+    chunks = make_chunks({CHUNK - 1: False, CHUNK: True}, chunks=2)
+    growing = Growing(digital=digital)
+    detector = EdgeDetector()
+    growing.append(chunks[0])
+    assert detector.find_first(growing.searched, value_to_find=0) == CHUNK - 1
+    growing.append(chunks[1])
+    assert detector.find_first(growing.searched, value_to_find=1) == CHUNK
+
+
+def test_end_limits_search(digital: bool):
+    chunks = make_chunks({CHUNK + 2: False}, chunks=2)
+    growing = Growing(digital=digital)
+    for chunk in chunks:
+        growing.append(chunk)
+    detector = EdgeDetector()
+    assert detector.find_first(growing.searched, value_to_find=0, end=CHUNK + 2) is None
+    assert detector.cursor == CHUNK + 2
+    assert detector.find_first(growing.searched, value_to_find=0) == CHUNK + 2
+
+
+def test_no_edge(digital: bool):
+    chunks = make_chunks({}, chunks=3)
+    results = find_per_chunk(chunks, value_to_find=0, digital=digital)
+    assert results == [None, None, None]
+
+
+@pytest.mark.parametrize("block_samples", [1, 2, 3, 1 << 14])
+def test_block_samples(block_samples: int):
+    array = np.array([1, 1, 1, 1, 1, 0, 0, 1], dtype=bool)
+    detector = EdgeDetector(block_samples=block_samples)
+    assert detector.find_first(array, value_to_find=0) == 5
+    assert detector.find_first(array, value_to_find=1) == 7
+
+
+def test_digital_array_matches_ndarray():
+    rng = np.random.default_rng(0)
+    samples = np.repeat(
+        rng.integers(0, 2, size=50).astype(bool), rng.integers(1, 7, size=50)
+    )
+    digital = DigitalArray()
+    for i in range(0, len(samples), 5):
+        digital.append(samples[i : i + 5])
+    for value_first in (0, 1):
+        # Find all edges, alternating the value to find
+        value_to_find = value_first
+        detector_array = EdgeDetector()
+        detector_digital = EdgeDetector()
+        while True:
+            idx0 = detector_array.find_first(samples, value_to_find)
+            assert detector_digital.find_first(digital, value_to_find) == idx0
+            if idx0 is None:
+                break
+            value_to_find = 1 - value_to_find
+
+
+@pytest.mark.parametrize("keep_shots", [0, 1, 2])
+def test_create_shot_directory_keeps_shots(tmp_path: pathlib.Path, keep_shots: int):
+    shot_directories = []
+    for _ in range(4):
+        shot_directory, _removed = create_shot_directory(
+            tmp_path, keep_shots=keep_shots
+        )
+        shot_directories.append(shot_directory)
+    remaining = sorted(tmp_path.glob("shot_*"))
+    if keep_shots == 0:
+        assert remaining == shot_directories
+    else:
+        assert remaining == shot_directories[-keep_shots:]
+
+
+def test_create_shot_directory_returns_removed(tmp_path: pathlib.Path):
+    first, removed = create_shot_directory(tmp_path, keep_shots=1)
+    assert removed == []
+    second, removed = create_shot_directory(tmp_path, keep_shots=1)
+    assert removed == [first]
+    assert sorted(tmp_path.glob("shot_*")) == [second]
@@ -0,0 +1,114 @@
+"""
+Tests of 'ad_continuity.ContinuityChecker': A stall of the host is not a loss, lost samples are.
+
+    python -m pytest test_ad_continuity.py
+"""
+
+from __future__ import annotations
+import typing
+
+import numpy as np
+import pytest
+
+from ad_continuity import ContinuityChecker, Gap, TOLERANCE_S
+
+SPS = 97656.25
+CHUNK = 1024
+CHUNK_S = CHUNK / SPS
+
+
+def feed(
+    duration_s: float,
+    stall_at_s: float = 0.0,
+    stall_s: float = 0.0,
+    catch_up: float = 2.0,
+    lost_at_s: float = 0.0,
+    lost_samples: int = 0,
+    drift: float = 0.0,
+    jitter_s: float = 0.002,
+) -> typing.List[Gap]:
+    """
+    Simulates the chunks arriving from the pico.
+    stall: From 'stall_at_s', the host does not read for 'stall_s'.
+      Then the chunks are read 'catch_up' times faster than the pico produces them.
+    lost: The chunks produced from 'lost_at_s' on, 'lost_samples' in total, never arrive.
+    drift: The pico clock is slower by this fraction.
+    """
+    assert lost_samples % CHUNK == 0
+    rng = np.random.default_rng(0)
+    checker = ContinuityChecker(sps=SPS)
+    read_s = 0.0
+    "The host is ready to read the next chunk"
+    chunks_to_lose = lost_samples // CHUNK
+    for i in range(int(duration_s / CHUNK_S)):
+        produced_s = (i + 1) * CHUNK_S * (1.0 + drift)
+        if chunks_to_lose > 0 and produced_s >= lost_at_s:
+            chunks_to_lose -= 1
+            continue
+        if stall_s and stall_at_s <= produced_s < stall_at_s + CHUNK_S:
+            read_s = produced_s + stall_s
+        now_s = max(produced_s, read_s) + rng.uniform(0.0, jitter_s)
+        read_s = max(produced_s, read_s) + CHUNK_S / catch_up
+        checker.chunk(samples=CHUNK, now_s=now_s)
+    return checker.gaps
+
+
+@pytest.mark.parametrize(
+    "stall_s,catch_up", [(0.05, 2.0), (0.3, 2.0), (1.0, 10.0), (2.0, 1.2)]
+)
+def test_stall_then_catch_up_is_no_gap(stall_s: float, catch_up: float):
+    gaps = feed(duration_s=10.0, stall_at_s=3.0, stall_s=stall_s, catch_up=catch_up)
+    assert gaps == []
+
+
+@pytest.mark.parametrize("lost_samples", [CHUNK * 5, CHUNK * 20, CHUNK * 100])
+def test_lost_samples_are_a_gap(lost_samples: int):
+    gaps = feed(duration_s=10.0, lost_at_s=3.0, lost_samples=lost_samples)
+    assert len(gaps) == 1
+    assert gaps[0].reason == "rate"
+    assert gaps[0].samples == pytest.approx(lost_samples, abs=0.01 * SPS)
+
+
+def test_loss_after_stall_is_a_gap():
+    lost_samples = CHUNK * 20
+    gaps = feed(
+        duration_s=10.0,
+        stall_at_s=2.0,
+        stall_s=0.5,
+        lost_at_s=5.0,
+        lost_samples=lost_samples,
+    )
+    assert len(gaps) == 1
+    assert gaps[0].samples == pytest.approx(lost_samples, abs=0.01 * SPS)
+
+
+def test_loss_smaller_than_tolerance_is_no_gap():
+    gaps = feed(
+        duration_s=5.0,
+        lost_at_s=2.0,
+        lost_samples=CHUNK * int(TOLERANCE_S * SPS / CHUNK / 2),
+    )
+    assert gaps == []
+
+
+@pytest.mark.parametrize("drift", [100e-6, -100e-6])
+def test_clock_drift_is_no_gap(drift: float):
+    gaps = feed(duration_s=600.0, drift=drift, jitter_s=0.02)
+    assert gaps == []
+
+
+def test_error_bits_are_a_gap():
+    checker = ContinuityChecker(sps=SPS)
+    checker.chunk(samples=CHUNK, now_s=CHUNK_S)
+    checker.chunk(samples=CHUNK, now_s=2 * CHUNK_S, errors=["ERROR_FIFO_OVERFLOW"])
+    assert checker.gaps == [
+        Gap(idx0_stream=CHUNK, samples=0, reason="ERROR_FIFO_OVERFLOW")
+    ]
+
+
+def test_dropped():
+    checker = ContinuityChecker(sps=SPS)
+    checker.chunk(samples=CHUNK, now_s=CHUNK_S)
+    checker.dropped(samples=3 * CHUNK)
+    checker.chunk(samples=CHUNK, now_s=5 * CHUNK_S)
+    assert checker.gaps == [Gap(idx0_stream=CHUNK, samples=3 * CHUNK, reason="queue")]
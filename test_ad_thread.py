@@ -0,0 +1,30 @@
+"""
+Tests of 'ad_thread.AdThread' against the synthetic source: No pico required.
+
+    python -m pytest test_ad_thread.py
+"""
+
+from __future__ import annotations
+
+import numpy as np
+
+from benchmarks.bench_getter_latency import measure
+
+SHOT_S = 1.0
+
+GETTER_MAX_S = 0.25
+"""
+Scheduling and the GIL delay a getter by some ms.
+A getter which waits for the shot in flight takes 'SHOT_S'.
+"""
+
+GETTER_P99_S = 0.001
+
+
+def test_getters_do_not_block_on_shot_in_flight():
+    result, duration_shot_s, latency_s = measure(duration_s=SHOT_S, threads=4)
+    assert result.timeout_detected
+    assert duration_shot_s >= SHOT_S
+    assert len(latency_s) > 1000
+    assert latency_s.max() < GETTER_MAX_S
+    assert np.percentile(latency_s, 99) < GETTER_P99_S
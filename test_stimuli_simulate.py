@@ -0,0 +1,36 @@
+"""
+The scenario regression of 'stimuli_simulate_all_scenarios' with pytest:
+Every scenario with an 'Expected' section at every sample rate.
+
+    python -m pytest test_stimuli_simulate.py
+"""
+
+from __future__ import annotations
+import typing
+
+import pytest
+
+from ad_low_noise_float_2023.constants import RegisterFilter1
+
+from stimuli_simulate_all_scenarios import check_scenario, scenarios_expected
+from stimuli_timeline import Timeline, compile_all
+
+
+@pytest.fixture(scope="module")
+def timelines() -> typing.Dict[int, Timeline]:
+    return compile_all()
+
+
+@pytest.mark.parametrize(
+    "register_filter1", list(RegisterFilter1), ids=lambda r: r.name
+)
+@pytest.mark.parametrize(
+    "scenario_id", scenarios_expected(), ids="scenario_{:02d}".format
+)
+def test_scenario(
+    scenario_id: int,
+    register_filter1: RegisterFilter1,
+    timelines: typing.Dict[int, Timeline],
+):
+    differences = check_scenario(scenario_id, register_filter1, timelines)
+    assert differences == []